@@ -0,0 +1,80 @@
+# Benchmark for building the property table: compares the old approach of
+# collecting every row in a list and calling insert_all with the chunked,
+# bulk-load writer in crate_to_db.
+#
+#   > uv run benchmarks/bulk_load.py --properties 1000000
+
+from argparse import ArgumentParser
+from pathlib import Path
+from rocrate_tabular.tabulator import ROCrateTabulator, PROPERTIES
+from sqlite_utils import Database
+from tinycrate.tinycrate import TinyCrate, minimal_crate
+import tempfile
+import time
+
+PROPS_PER_ENTITY = 10
+
+
+def synthetic_crate(crate_dir, n_properties):
+    """Write a crate with about n_properties rows in its property table:
+    each entity has a type, a name, a relation to the root and some text
+    properties"""
+    crate = minimal_crate(name="Bulk load benchmark")
+    for i in range(n_properties // PROPS_PER_ENTITY):
+        props = {"name": f"Entity {i}", "memberOf": {"@id": "./"}}
+        for j in range(PROPS_PER_ENTITY - 3):
+            props[f"prop{j}"] = f"value {i} {j}"
+        crate.add("Thing", f"#e{i:08d}", props)
+    crate.write_json(Path(crate_dir))
+
+
+def baseline(crate_dir, db_file):
+    """The property table build before chunked writing"""
+    tb = ROCrateTabulator()
+    tb.crate = TinyCrate(tb._load_crate(str(crate_dir)))
+    tb.index_names()
+    db = Database(db_file, recreate=True)
+    properties = db["property"].create(PROPERTIES)
+    start = time.perf_counter()
+    seq = 0
+    propList = []
+    for e in tb.crate.all():
+        for row in tb.entity_properties(e):
+            row = dict(zip(PROPERTIES, row))
+            row["row_id"] = seq
+            seq += 1
+            propList.append(row)
+    properties.insert_all(propList)
+    return seq, time.perf_counter() - start
+
+
+def chunked(crate_dir, db_file, batch_size):
+    tb = ROCrateTabulator()
+    tb.batch_size = batch_size
+    start = time.perf_counter()
+    tb.crate_to_db(str(crate_dir), db_file)
+    elapsed = time.perf_counter() - start
+    return tb.load_stats["rows"], elapsed
+
+
+def report(label, rows, seconds):
+    print(f"{label:>10}: {rows} rows in {seconds:.2f}s ({rows / seconds:.0f} rows/sec)")
+
+
+def main():
+    ap = ArgumentParser("Property table bulk load benchmark")
+    ap.add_argument("--properties", type=int, default=1000000)
+    ap.add_argument("--batch-size", type=int, default=10000)
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        synthetic_crate(tmp, args.properties)
+        rows, t_base = baseline(tmp, tmp / "baseline.db")
+        report("baseline", rows, t_base)
+        rows, t_chunked = chunked(tmp, tmp / "chunked.db", args.batch_size)
+        report("chunked", rows, t_chunked)
+        print(f"speedup: {t_base / t_chunked:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
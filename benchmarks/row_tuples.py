@@ -0,0 +1,98 @@
+# Benchmark for the property rows made while building the property table:
+# compares the old five-key dicts, which were numbered and then converted to
+# parameter tuples, with the tuples which entity_properties now yields.
+#
+#   > uv run benchmarks/row_tuples.py --properties 1000000
+
+from argparse import ArgumentParser
+from collections import deque
+from itertools import islice
+from pathlib import Path
+from rocrate_tabular.tabulator import (
+    ROCrateTabulator,
+    PROPERTIES,
+    BATCH_SIZE,
+    get_as_id,
+    get_as_list,
+    sql_value,
+)
+from tinycrate.tinycrate import TinyCrate
+from bulk_load import synthetic_crate
+import tempfile
+import time
+import tracemalloc
+
+
+def dict_rows(tb, entities):
+    """The rows as they were built before tuples: a dict per value, with
+    row_id added afterwards and then converted to parameters"""
+    seq = 0
+    for e in entities:
+        eid = e["@id"]
+        ename = e["name"]
+        for key, value in e.props.items():
+            if key == "@id":
+                continue
+            for v in get_as_list(value):
+                tid = get_as_id(v)
+                row = {
+                    "source_id": eid,
+                    "source_name": ename,
+                    "property_label": key,
+                }
+                if tid is not None:
+                    row["target_id"] = tid
+                    row["value"] = tb.entity_names.get(tid, "")
+                else:
+                    row["value"] = v
+                row["row_id"] = seq
+                seq += 1
+                yield row
+
+
+def dict_params(rows):
+    return (tuple(sql_value(row.get(c)) for c in PROPERTIES) for row in rows)
+
+
+def tuple_rows(tb, entities):
+    return tb._property_rows(entities)
+
+
+def measure(label, rows_fn, params_fn, tb):
+    """Time generating the parameters for every row, and trace the memory
+    allocated for one batch of the rows themselves"""
+    entities = tb.crate.all()
+    start = time.perf_counter()
+    rows = sum(1 for _ in params_fn(rows_fn(tb, entities)))
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    rows_iter = rows_fn(tb, entities)
+    batch = list(islice(rows_iter, BATCH_SIZE))
+    batch_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    deque(rows_iter, maxlen=0)
+    per_million = seconds * 1000000 / rows
+    print(
+        f"{label:>7}: {per_million:.2f}s per million properties, "
+        f"{batch_bytes / len(batch):.0f} bytes allocated per row"
+    )
+    return per_million
+
+
+def main():
+    ap = ArgumentParser("Property row representation benchmark")
+    ap.add_argument("--properties", type=int, default=1000000)
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        synthetic_crate(tmp, args.properties)
+        tb = ROCrateTabulator()
+        tb.crate = TinyCrate(tb._load_crate(str(tmp)))
+        tb.index_names()
+        t_dicts = measure("dicts", dict_rows, dict_params, tb)
+        t_tuples = measure("tuples", tuple_rows, iter, tb)
+        print(f"speedup: {t_dicts / t_tuples:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
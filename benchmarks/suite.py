@@ -0,0 +1,224 @@
+# Benchmark suite: builds a synthetic crate of a given size and times each
+# phase of the pipeline, with the process's peak memory after each one.
+# Results can be saved as JSON and compared with an earlier run, e.g.
+#
+#   > uv run benchmarks/suite.py --entities 100000 --save results.json
+#   > uv run benchmarks/suite.py --baseline benchmarks/baseline.json
+#
+# A phase is flagged as a regression if it is more than --tolerance slower
+# (or bigger) than the baseline. The exit status is 1 if there were any.
+
+from argparse import ArgumentParser
+from contextlib import contextmanager, redirect_stdout
+from pathlib import Path
+from rocrate_tabular.tabulator import ROCrateTabulator
+from tinycrate.tinycrate import minimal_crate
+import copy
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# phases shorter than this aren't compared, as they are mostly noise
+MIN_SECONDS = 0.05
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do".split()
+
+
+def synthetic_crate(crate_dir, entities, types, fanout, texts, seed=0):
+    """Write a crate with entities spread evenly over types. Each entity has
+    some literal properties, a relation to the root dataset and fanout
+    relations to other entities - more than MAX_NUMBERED_COLS of these are
+    written to a junction table. The first texts entities have a text file
+    as their indexableText."""
+    rng = random.Random(seed)
+    crate_dir = Path(crate_dir)
+    crate = minimal_crate(name="Benchmark crate")
+    for i in range(entities):
+        eid = f"#e{i:08d}"
+        props = {
+            "name": f"Entity {i}",
+            "description": " ".join(rng.choices(WORDS, k=12)),
+            "memberOf": {"@id": "./"},
+            "linksTo": [
+                {"@id": f"#e{rng.randrange(entities):08d}"} for _ in range(fanout)
+            ],
+        }
+        for j in range(3):
+            props[f"prop{j}"] = rng.randrange(1000000)
+        if i < texts:
+            text_id = f"texts/{i:08d}.txt"
+            props["indexableText"] = {"@id": text_id}
+            crate.add("File", text_id, {"name": text_id})
+        crate.add(f"Type{i % types}", eid, props)
+    if texts:
+        (crate_dir / "texts").mkdir(parents=True, exist_ok=True)
+        for i in range(min(texts, entities)):
+            with open(crate_dir / f"texts/{i:08d}.txt", "w", encoding="utf-8") as fh:
+                fh.write(" ".join(rng.choices(WORDS, k=500)))
+    # an inline context, so that the export doesn't have to fetch one
+    crate.context = {"@vocab": "http://schema.org/"}
+    crate.write_json(crate_dir)
+
+
+def max_rss_mb():
+    """The peak resident set size of this process so far"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    if sys.platform == "darwin":
+        rss = rss / 1024
+    return rss / 1024
+
+
+class Phases:
+    """Times phases of the benchmark, and optionally traces the peak memory
+    allocated by Python during each one"""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.results = {}
+
+    @contextmanager
+    def phase(self, name):
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        yield
+        result = {"seconds": time.perf_counter() - start}
+        if self.trace_memory:
+            result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.stop()
+        result["max_rss_mb"] = max_rss_mb()
+        self.results[name] = result
+        print(f"{name:>16}: {result['seconds']:.2f}s", file=sys.stderr)
+
+
+def run(args, work_dir):
+    crate_dir = work_dir / "crate"
+    db_file = work_dir / "benchmark.db"
+    phases = Phases(args.trace_memory)
+    with phases.phase("generate"):
+        synthetic_crate(
+            crate_dir, args.entities, args.types, args.fanout, args.texts, args.seed
+        )
+    tb = ROCrateTabulator()
+    with phases.phase("crate_to_db"):
+        tb.crate_to_db(str(crate_dir), db_file, stream=args.stream)
+    tb.infer_config()
+    tb.cf["tables"] = tb.cf["potential_tables"]
+    tb.cf["potential_tables"] = {}
+    tables = list(tb.cf["tables"])
+    # entity_table makes its own plan, so this is timed on a copy
+    cf = copy.deepcopy(tb.cf)
+    with phases.phase("entity_table_plan"):
+        for table in tables:
+            tb.entity_table_plan(table)
+    tb.cf = cf
+    tb.text_prop = "indexableText" if args.texts else None
+    tb.engine = args.engine
+    with phases.phase("entity_tables"):
+        for table, allprops in tb.entity_tables(tables, jobs=args.jobs):
+            tb.cf["tables"][table]["all_props"] = list(allprops)
+    tb.cf["export_queries"] = {
+        f"{table}.csv": f"SELECT * FROM [{table}]" for table in tables
+    }
+    tb.cf["export_queries"]["property.csv"] = "SELECT * FROM property"
+    with phases.phase("export_csv"):
+        tb.export_csv(work_dir / "csv", jobs=args.jobs)
+    properties = tb.db["property"].count
+    tb.close()
+    return {
+        "params": {
+            "entities": args.entities,
+            "types": args.types,
+            "fanout": args.fanout,
+            "texts": args.texts,
+            "seed": args.seed,
+            "stream": args.stream,
+            "jobs": args.jobs,
+            "engine": args.engine,
+            "trace_memory": args.trace_memory,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "properties": properties,
+        "phases": phases.results,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print each phase next to the baseline, and return a list of the
+    regressions"""
+    if results["params"] != baseline["params"]:
+        print("warning: parameters differ from the baseline's")
+    regressions = []
+    for name, result in results["phases"].items():
+        base = baseline["phases"].get(name)
+        if base is None:
+            continue
+        for measure in ["seconds", "peak_mb", "max_rss_mb"]:
+            if measure not in result or measure not in base:
+                continue
+            new, old = result[measure], base[measure]
+            ratio = new / old if old else 1.0
+            flag = ""
+            if ratio > 1 + tolerance:
+                if measure != "seconds" or new - old > MIN_SECONDS:
+                    flag = "  REGRESSION"
+                    regressions.append((name, measure, old, new))
+            print(f"{name:>18} {measure:>10}: {old:10.2f} -> {new:10.2f}{flag}")
+    return regressions
+
+
+def main():
+    ap = ArgumentParser("Benchmark suite")
+    ap.add_argument("--entities", type=int, default=20000)
+    ap.add_argument("--types", type=int, default=5)
+    ap.add_argument("--fanout", type=int, default=20, help="Relations from each entity")
+    ap.add_argument("--texts", type=int, default=200, help="Entities with a text file")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--stream", action="store_true")
+    ap.add_argument("-j", "--jobs", type=int, default=1)
+    ap.add_argument("--engine", default="python", choices=["python", "sql"])
+    ap.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Trace the peak Python memory of each phase (slows it down)",
+    )
+    ap.add_argument("--save", type=Path, help="Write the results to this file")
+    ap.add_argument("--baseline", type=Path, help="Compare with these results")
+    ap.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Fraction by which a phase can exceed the baseline",
+    )
+    args = ap.parse_args()
+    # keep the library's progress messages out of the report
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+        with redirect_stdout(devnull):
+            results = run(args, Path(tmp))
+    print(f"{results['properties']} properties")
+    if args.save:
+        with open(args.save, "w") as fh:
+            json.dump(results, fh, indent=2)
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,33 @@
 from os import PathLike
 
-from tinycrate.tinycrate import TinyCrate, TinyCrateException, minimal_crate
+from tinycrate.tinycrate import TinyCrate, TinyEntity, minimal_crate
 from argparse import ArgumentParser
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib.parse import unquote, urljoin
 from sqlite_utils import Database
 from tqdm import tqdm
+import base64
+import copy
 import csv
+import gzip
+import hashlib
+import io
 import json
-import re
+import lzma
 import requests
+import sqlite3
 import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from dataclasses import dataclass, field
+from functools import lru_cache, partial
+from itertools import chain, count, groupby, islice
+from operator import itemgetter
 
 # FIXME: add real logging
 
@@ -62,9 +79,114 @@ PROPERTIES = {
     "value": str,
 }
 
+# the hash of each entity's JSON-LD, for incremental builds, and its name as
+# ROCrateTabulator.index_names stores it, for relation rows
+ENTITY_HASHES = {
+    "entity_id": str,
+    "hash": str,
+    "name": str,
+}
+
+# per type and property: how many entities have it, the most values and
+# relations any one entity has, the share of its values which are relations,
+# the number of distinct targets and the rowid where it first appears.
+# Built by ROCrateTabulator.build_property_stats after each load
+PROPERTY_STATS = {
+    "entity_type": str,
+    "property_label": str,
+    "entities": int,
+    "max_values": int,
+    "max_targets": int,
+    "relation_share": float,
+    "distinct_targets": int,
+    "position": int,
+}
+
+# in a database built from a batch of crates by crates_to_db, every table
+# has this column, which is part of its primary key, and the batch_crate
+# table records how each crate was loaded
+CRATE_ID = "crate_id"
+
+BATCH_CRATES = {
+    "crate_id": str,
+    "crate_uri": str,
+    "rows": int,
+    "seconds": float,
+    "error": str,
+}
+
+# the table which --concat loads a crate's CSV files into, and the columns
+# which say where each row came from
+CSV_TABLE = "csv_files"
+CSV_SOURCE = {"source_file": str, "source_row": int}
+
+# the crate's JSON-LD @context, so that terms can be resolved without the
+# crate in memory
+CRATE_CONTEXT = {"context": str}
+
+JUNCTION_COLUMNS = {
+    "seq": int,
+    "entity_id": str,
+    "target_id": str,
+}
+
+# indexes on the property table, built after the bulk load, for the lookups
+# by entity, by @type and by relation target done by the fetch_ helpers.
+# property_source_id is deliberately not covering, so that an entity's rows
+# come back in the order they were loaded
+PROPERTY_INDEXES = {
+    "property_source_id": ["source_id"],
+    "property_label_value": ["property_label", "value", "source_id"],
+    "property_target_id": ["target_id"],
+}
+
+# number of targets whose properties are kept for expand_props
+EXPANSION_CACHE_SIZE = 10000
+
+# threads used to load text_prop files, and the largest file which will be
+# loaded
+TEXT_WORKERS = 8
+TEXT_MAX_BYTES = 64 * 1024 * 1024
+
+HTTP_POOL_SIZE = 32
+
+TEXT_FAILURES = {
+    "entity_table": str,
+    "entity_id": str,
+    "target_id": str,
+    "error": str,
+}
+
 MAX_NUMBERED_COLS = 10
 # MAX_NUMBERED_COLS = 999  # sqllite limit
 
+# export file formats and compressions, by file extension, with the media
+# types used for encodingFormat in the schema crate
+EXPORT_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+EXPORT_COMPRESSIONS = {".gz": "gzip", ".xz": "xz"}
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/jsonl",
+    "gzip": "application/gzip",
+    "xz": "application/x-xz",
+}
+
+# characters read per chunk when streaming the JSON-LD
+STREAM_CHUNK_SIZE = 1 << 16
+
+# rows per executemany when writing the property, entity and junction tables
+# and loading CSV files, and per fetchmany when exporting
+BATCH_SIZE = 10000
+
+# pragmas used while building the property table - durability is traded for
+# speed because a failed build is simply rebuilt. cache_size is in KiB when
+# negative.
+BULK_LOAD_PRAGMAS = {
+    "journal_mode": "MEMORY",
+    "synchronous": "OFF",
+    "cache_size": -256000,
+}
+
 
 def get_as_list(v):
     """Ensures that a value is a list"""
@@ -75,6 +197,146 @@ def get_as_list(v):
     return [v]
 
 
+def sql_value(v):
+    """JSON-encode values which sqlite can't store, as sqlite-utils does"""
+    if isinstance(v, (dict, list, tuple)):
+        return json.dumps(v, default=repr)
+    return v
+
+
+def numbered_column(prop, i):
+    """The column name for the ith value of a property, following
+    EntityRecord.set_property_numbered"""
+    if i == 0:
+        return prop
+    return f"{prop}_{min(i, MAX_NUMBERED_COLS)}"
+
+
+def placeholders(values):
+    """A "?, ?, ..." parameter list for values"""
+    return ", ".join("?" for _ in values)
+
+
+def unique_columns(specs):
+    """The column names from ROCrateTabulator.column_specs without
+    duplicates, keeping their order"""
+    return list(dict.fromkeys(spec[0] for spec in specs))
+
+
+def can_pivot(specs):
+    """Whether the SQL engine can build a table with these column_specs. It
+    can't if two properties map to the same column, eg a literal "author_id"
+    and the targets of "author", or if a property has more than
+    MAX_NUMBERED_COLS values: EntityRecord numbers these on the fly."""
+    return len(unique_columns(specs)) == len(specs)
+
+
+def bounded_map(pool, fn, items, window):
+    """Like pool.map, but only submits up to window items ahead of the one
+    being returned, so that results don't pile up in memory"""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def find_crates(path):
+    """Return a list of (crate_id, crate_uri) for a batch of crates. path is
+    either a directory, which is searched for ro-crate-metadata.json files,
+    each crate's id being its directory relative to path, or a manifest
+    listing one crate directory or URL per line, which is also its id.
+    Relative directories in a manifest are relative to the manifest. Blank
+    lines and lines starting with # are skipped."""
+    path = Path(path)
+    if path.is_dir():
+        return [
+            (meta.parent.relative_to(path).as_posix(), str(meta.parent))
+            for meta in sorted(path.rglob("ro-crate-metadata.json"))
+        ]
+    crates = []
+    seen = set()
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            crate_id = line.strip()
+            if not crate_id or crate_id.startswith("#"):
+                continue
+            if crate_id in seen:
+                raise ROCrateTabulatorException(f"{crate_id} is in {path} twice")
+            seen.add(crate_id)
+            crate_uri = crate_id
+            if crate_id[:4] != "http":
+                crate_uri = str(path.parent / crate_id)
+            crates.append((crate_id, crate_uri))
+    return crates
+
+
+def crate_table_sql(name, info):
+    """The CREATE TABLE statement for a table in a batch database, given
+    the PRAGMA table_info of the table in a single crate's database: the
+    same columns and primary key, with crate_id in front of both"""
+    columns = [f"[{CRATE_ID}] TEXT"]
+    columns += [f"[{row[1]}] {row[2]}".rstrip() for row in info]
+    pk = [row[1] for row in sorted(info, key=itemgetter(5)) if row[5]]
+    if pk:
+        keys = ", ".join(f"[{c}]" for c in [CRATE_ID, *pk])
+        columns.append(f"PRIMARY KEY ({keys})")
+    return "CREATE TABLE [{}] ({})".format(name, ", ".join(columns))
+
+
+def csv_header(path):
+    """Return the column names in the first row of a CSV file"""
+    with open(path, newline="", encoding="utf-8") as fh:
+        return next(csv.reader(fh), [])
+
+
+def entity_hash(props):
+    """A hash of an entity's JSON-LD, for detecting changes between builds"""
+    return hashlib.sha1(
+        json.dumps(props, sort_keys=True, default=repr).encode("utf-8")
+    ).hexdigest()
+
+
+def export_format(filename, spec):
+    """Work out the query, format and compression of an export_queries
+    entry. spec is either a query, or a dict with "query" and optionally
+    "format" and "compression": anything not given is taken from the
+    filename's extensions, defaulting to uncompressed csv"""
+    if isinstance(spec, str):
+        spec = {"query": spec}
+    suffixes = [s.lower() for s in Path(filename).suffixes]
+    compression = None
+    if suffixes and suffixes[-1] in EXPORT_COMPRESSIONS:
+        compression = EXPORT_COMPRESSIONS[suffixes.pop()]
+    fmt = EXPORT_FORMATS.get(suffixes[-1], "csv") if suffixes else "csv"
+    fmt = spec.get("format", fmt)
+    compression = spec.get("compression", compression)
+    if fmt not in EXPORT_MEDIA_TYPES or fmt in EXPORT_COMPRESSIONS.values():
+        raise ROCrateTabulatorException(f"Unknown export format {fmt}")
+    if compression not in (None, *EXPORT_COMPRESSIONS.values()):
+        raise ROCrateTabulatorException(f"Unknown export compression {compression}")
+    return spec["query"], fmt, compression
+
+
+def open_export(path, compression=None):
+    """Open an export file for writing text, compressing it on the fly"""
+    if compression == "gzip":
+        return gzip.open(path, "wt", encoding="utf-8", newline="")
+    if compression == "xz":
+        return lzma.open(path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def jsonl_value(value):
+    """JSON encoder default for JSON Lines exports: blobs are written as
+    base64 strings"""
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    raise TypeError(f"Can't export {type(value).__name__} value as JSON")
+
+
 def get_as_id(v):
     """If v is an ID, return it or else return None"""
     if type(v) is dict:
@@ -88,6 +350,280 @@ class ROCrateTabulatorException(Exception):
     pass
 
 
+class GraphStream:
+    """Incremental parser for an RO-Crate's JSON-LD which yields the
+    entities of the @graph one at a time, so that the whole graph is never
+    held in memory. Other top-level keys, like @context, are stored in
+    self.top as they are encountered."""
+
+    def __init__(self, fh, chunk_size=STREAM_CHUNK_SIZE):
+        self.fh = fh
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.top = {}
+        self.has_graph = False
+
+    def __iter__(self):
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key == "@graph":
+                self.has_graph = True
+                yield from self._graph()
+            else:
+                self.top[key] = self._value()
+            if self._expect(",}") == "}":
+                return
+
+    def _graph(self):
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(",]") == "]":
+                return
+
+    def _fill(self):
+        """Discard what's been parsed and read another chunk. The read size
+        grows with the unparsed buffer so that a very large entity doesn't
+        get re-parsed once per chunk"""
+        chunk = self.fh.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if not chunk:
+            return False
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """Skip whitespace and return the next character"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ROCrateTabulatorException("Unexpected end of JSON-LD")
+
+    def _expect(self, chars):
+        c = self._peek()
+        if c not in chars:
+            raise ROCrateTabulatorException(
+                f"Malformed JSON-LD: expected one of '{chars}', got '{c}'"
+            )
+        self.pos += 1
+        return c
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                if self._fill():
+                    continue
+                raise ROCrateTabulatorException(f"Malformed JSON-LD: {e}")
+            # a number or literal could be cut off at the end of the buffer
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+class HTTPCache:
+    """On-disk cache for files fetched over http. Downloads are streamed to
+    disk, and cached files are revalidated with If-None-Match and
+    If-Modified-Since rather than downloaded again. self.stats counts
+    downloads, and revalidations which found the cached file still
+    current."""
+
+    def __init__(self, cache_dir, session=None):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.session = session or requests.Session()
+        self.stats = {"downloaded": 0, "not_modified": 0}
+
+    def fetch(self, url):
+        """Return the path of the cached copy of url, fetching or
+        revalidating it first"""
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        body = self.cache_dir / key
+        meta_file = self.cache_dir / f"{key}.json"
+        headers = {}
+        if body.is_file() and meta_file.is_file():
+            with open(meta_file, "r") as fh:
+                meta = json.load(fh)
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            with self.session.get(url, headers=headers, stream=True) as response:
+                if response.status_code == 304:
+                    self.stats["not_modified"] += 1
+                    return body
+                response.raise_for_status()
+                part = self.cache_dir / f"{key}.part"
+                with open(part, "wb") as fh:
+                    for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                        fh.write(chunk)
+                part.replace(body)
+                meta = {
+                    "url": url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                }
+        except requests.RequestException as e:
+            raise ROCrateTabulatorException(f"http request to {url} failed: {e}")
+        with open(meta_file, "w") as fh:
+            json.dump(meta, fh)
+        self.stats["downloaded"] += 1
+        return body
+
+
+class Instrumentation:
+    """Records what a tabulator does: when each phase started, how long it
+    took and how many rows it processed, how many SQL statements of each
+    kind were run and how long they took, and cache statistics. Progress
+    bars are shown with tqdm if progress is True.
+
+    SQL statements are only timed if trace_sql is True, as it adds a little
+    to each one. Only the time to execute a statement is counted, not the
+    time spent fetching rows from its cursor.
+
+    Subclass this and override phase_started, phase_ended, statement and
+    cache to send the records elsewhere as they happen."""
+
+    def __init__(self, progress=True, trace_sql=False):
+        self.progress_bars = progress
+        self.trace_sql = trace_sql
+        self.phases = []
+        self.sql = {}
+        self.caches = {}
+        # counts from worker processes' caches, added to this process's own
+        # by cache()
+        self.worker_caches = {}
+        # statements can come from export threads
+        self._sql_lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name, **info):
+        """Context manager which records a phase called name, with any info
+        given. It yields the phase's record, to which the caller can add
+        "rows" or anything else."""
+        record = {"name": name, "started": time.time(), **info}
+        self.phase_started(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            self.phase_ended(record)
+
+    def phase_started(self, record):
+        pass
+
+    def phase_ended(self, record):
+        self.phases.append(record)
+
+    def progress(self, iterable, total=None):
+        """Wrap an iterable in a progress bar, if they're switched on"""
+        if not self.progress_bars:
+            return iterable
+        return tqdm(iterable, total=total)
+
+    def statement(self, sql, seconds, rows):
+        """Count a SQL statement by its first keyword"""
+        kind = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+        with self._sql_lock:
+            stats = self.sql.setdefault(kind, {"count": 0, "seconds": 0.0, "rows": 0})
+            stats["count"] += 1
+            stats["seconds"] += seconds
+            stats["rows"] += max(rows, 0)
+
+    def cache(self, name, **stats):
+        """Record a cache's statistics, adding any counts merged from
+        worker processes' caches of the same name"""
+        merged = self.worker_caches.get(name, {})
+        self.caches[name] = {
+            key: value + merged.get(key, 0) for key, value in stats.items()
+        }
+
+    def connect(self, db_file, recreate=False):
+        """Open a sqlite-utils Database, as Database(db_file, recreate) does,
+        timing its statements if trace_sql is set"""
+        if not self.trace_sql:
+            return Database(db_file, recreate=recreate)
+        if recreate and Path(db_file).exists():
+            Path(db_file).unlink()
+        return Database(self.connection(str(db_file)))
+
+    def connection(self, database, **kwargs):
+        """Open a sqlite3 connection, timing its statements if trace_sql is
+        set"""
+        if not self.trace_sql:
+            return sqlite3.connect(database, **kwargs)
+        conn = sqlite3.connect(database, factory=TimedConnection, **kwargs)
+        conn.instrumentation = self
+        return conn
+
+    def to_dict(self):
+        caches = {**self.worker_caches, **self.caches}
+        return {"phases": self.phases, "sql": self.sql, "caches": caches}
+
+    def merge(self, metrics):
+        """Add the phases, statements and cache counts from another
+        instrumentation's to_dict(), such as a worker process's. The sizes
+        of its caches are its own, and aren't added."""
+        for record in metrics["phases"]:
+            self.phase_ended(record)
+        for name, stats in metrics["caches"].items():
+            totals = self.worker_caches.setdefault(name, {})
+            for key, value in stats.items():
+                if key not in ("maxsize", "currsize"):
+                    totals[key] = totals.get(key, 0) + value
+        with self._sql_lock:
+            for kind, other in metrics["sql"].items():
+                stats = self.sql.setdefault(
+                    kind, {"count": 0, "seconds": 0.0, "rows": 0}
+                )
+                for key, value in other.items():
+                    stats[key] += value
+
+    def write(self, metrics_file):
+        """Write everything recorded as JSON"""
+        with open(metrics_file, "w") as fh:
+            json.dump(self.to_dict(), fh, indent=2, default=str)
+
+
+class TimedConnection(sqlite3.Connection):
+    """A sqlite3 connection which reports the time taken by each statement
+    to its instrumentation"""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        cursor = super().execute(sql, parameters)
+        self.instrumentation.statement(
+            sql, time.perf_counter() - start, cursor.rowcount
+        )
+        return cursor
+
+    def executemany(self, sql, parameters):
+        start = time.perf_counter()
+        cursor = super().executemany(sql, parameters)
+        self.instrumentation.statement(
+            sql, time.perf_counter() - start, cursor.rowcount
+        )
+        return cursor
+
+
 @dataclass
 class EntityRecord:
     """Class which represents an entity as mapped to a database row,
@@ -101,6 +637,7 @@ class EntityRecord:
     props: set = field(default_factory=set)
     data: dict = field(default_factory=dict)
     junctions: dict = field(default_factory=dict)
+    text_target: str = None
 
     def build(self, properties):
         """Takes the properties of this entity and builds a dictionary to
@@ -116,10 +653,9 @@ class EntityRecord:
             target = prop_row["target_id"]
             self.props.add(prop)
             if prop == self.text_prop:
-                try:
-                    self.data[prop] = self.crate.get(target).fetch()
-                except TinyCrateException as e:
-                    self.data[prop] = f"load failed: {e}"
+                # the text is loaded later by ROCrateTabulator.load_texts
+                self.data[prop] = value if target is None else None
+                self.text_target = target
             else:
                 if prop in self.expand_props and target:
                     self.add_expanded_property(prop, target)
@@ -131,7 +667,7 @@ class EntityRecord:
     def add_expanded_property(self, prop, target):
         """Do a subquery on a target ID to make expanded properties like
         author_name author_id"""
-        for ep_row in self.tabulator.fetch_properties(target):
+        for ep_row in self.tabulator.fetch_expanded(target):
             expanded_prop = f"{prop}_{ep_row['property_label']}"
             # Special case - if this is indexable text then we want to read t
             self.props.add(expanded_prop)
@@ -173,15 +709,48 @@ class EntityRecord:
 
 
 class ROCrateTabulator:
-    def __init__(self):
+    def __init__(self, expansion_cache_size=EXPANSION_CACHE_SIZE, instrumentation=None):
         self.crate_dir = None
         self.db_file = None
         self.db = None
         self.crate = None
+        # id -> name of every entity in the crate, for relation rows
+        self.entity_names = {}
         self.cf = None
         self.text_prop = None
+        self.text_workers = TEXT_WORKERS
+        self.text_max_bytes = TEXT_MAX_BYTES
+        # one pooled session for all http requests, big enough for the text
+        # loading threads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.http_cache = None
+        self.export_stats = {}
         self.schemaCrate = minimal_crate()
         self.encodedProps = {}
+        self.batch_size = BATCH_SIZE
+        self.indexes = True
+        self.incremental = False
+        self.stream = False
+        # "python" builds entity tables with EntityRecord, "sql" with
+        # ROCrateTabulator.pivot_entities
+        self.engine = "python"
+        # whether entity_table builds the full-text indexes in fts_columns.
+        # Worker processes leave them to the process which merges their
+        # tables, as an index's rowids are those of its own table
+        self.fts = True
+        # LRU cache of the property rows of expanded targets, shared by all
+        # entity tables. Use self.fetch_expanded.cache_info() to size it.
+        self.fetch_expanded = lru_cache(maxsize=expansion_cache_size)(
+            self._fetch_expanded
+        )
+        self.load_stats = None
+        self.instrumentation = instrumentation or Instrumentation()
+        # (propertyUrl, description) of each column's base term, shared by
+        # all of the export schemas
+        self.terms = {}
 
     def read_config(self, config_file):
         """Load config from file"""
@@ -207,11 +776,14 @@ class ROCrateTabulator:
             )
         self.cf = {"export_queries": {}, "tables": {}, "potential_tables": {}}
 
-        for attype in self.fetch_types():
+        for attype, stats in groupby(
+            self.fetch_property_stats(), key=itemgetter("entity_type")
+        ):
             self.cf["potential_tables"][attype] = {
-                "all_props": [],
+                "all_props": [row["property_label"] for row in stats],
                 "ignore_props": [],
                 "expand_props": [],
+                "fts_columns": [],
             }
 
     def write_config(self, config_file):
@@ -230,151 +802,1173 @@ class ROCrateTabulator:
         else:
             config_file.seek(0)
 
-    def crate_to_db(self, crate_uri, db_file, rebuild=True):
-        """Load the crate and build the properties and relations tables"""
+    def crate_to_db(
+        self,
+        crate_uri,
+        db_file,
+        rebuild=True,
+        stream=False,
+        indexes=True,
+        incremental=False,
+    ):
+        """Load the crate and build the properties and relations tables.
+
+        If stream is True, the JSON-LD is parsed one entity at a time and
+        rows are written as they are produced, rather than loading the whole
+        crate into memory first. Relation names are filled in afterwards
+        with a pass over the property table. The graph is never held in
+        memory: everything which would be looked up in it is read from the
+        property table, and the @context from the crate_context table, so
+        an existing database can be reopened without parsing the crate.
+
+        If indexes is True, PROPERTY_INDEXES are created once the rows have
+        been loaded, or added to an existing database if they are missing.
+
+        If incremental is True and db_file was built by an earlier run, only
+        the rows for entities which have changed are replaced - see
+        update_properties. This assumes that the table config hasn't
+        changed since the last run."""
         self.crate_dir = crate_uri
-        try:
-            jsonld = self._load_crate(crate_uri)
-            self.crate = TinyCrate(jsonld)
-        except Exception as e:
-            raise ROCrateTabulatorException(f"Crate load failed: {e}")
         self.db_file = db_file
+        self.indexes = indexes
+        self.incremental = False
+        self.stream = stream
+        self.fetch_expanded.cache_clear()
+        self.terms = {}
+        if incremental and not self._can_update(db_file):
+            incremental = False
+        if stream:
+            return self._stream_to_db(crate_uri, db_file, rebuild, incremental)
+        with self.instrumentation.phase("load_crate", crate=str(crate_uri)):
+            try:
+                jsonld = self._load_crate(crate_uri)
+                self.crate = TinyCrate(jsonld)
+                self.index_names()
+            except Exception as e:
+                raise ROCrateTabulatorException(f"Crate load failed: {e}")
         if not rebuild:
             if not Path(db_file).is_file():
                 raise ROCrateTabulatorException(f"db file {db_file} not found")
-            self.db = Database(self.db_file)
+            self.db = self.instrumentation.connect(self.db_file)
+            if self.indexes:
+                self.create_indexes()
+            if not self.db["property_stats"].exists():
+                self.build_property_stats()
             return
-        self.db = Database(self.db_file, recreate=True)
-        properties = self.db["property"].create(PROPERTIES)
-        seq = 0
-        propList = []
-        for e in tqdm(self.crate.all()):
-            for row in self.entity_properties(e):
-                row["row_id"] = seq
-                seq += 1
-                propList.append(row)
-        properties.insert_all(propList)
+        if incremental:
+            self.db = self.instrumentation.connect(self.db_file)
+            self.update_properties(self.instrumentation.progress(self.crate.all()))
+        else:
+            self.build_properties(self.instrumentation.progress(self.crate.all()))
+        self.write_context()
+        return self.db
+
+    def _stream_to_db(self, crate_uri, db_file, rebuild, incremental):
+        """Streaming version of crate_to_db. self.crate is left holding the
+        crate's context but an empty graph. If rebuild is False and the
+        database has the context, the crate isn't read at all."""
+        if not rebuild:
+            if not Path(db_file).is_file():
+                raise ROCrateTabulatorException(f"db file {db_file} not found")
+            self.db = self.instrumentation.connect(self.db_file)
+            context = self.read_context()
+            if context is not None:
+                self.crate = TinyCrate({"@context": context, "@graph": []})
+                self.entity_names = {}
+                if self.indexes:
+                    self.create_indexes()
+                if not self.db["property_stats"].exists():
+                    self.build_property_stats()
+                return self.db
+        try:
+            with self._open_crate(crate_uri) as jfh:
+                graph = GraphStream(jfh)
+                self.crate = TinyCrate({"@context": None, "@graph": []})
+                self.entity_names = {}
+                entities = (TinyEntity(self.crate, e) for e in graph)
+                if not rebuild:
+                    for _ in graph:
+                        pass
+                    self.db = self.instrumentation.connect(self.db_file)
+                    if self.indexes:
+                        self.create_indexes()
+                    if not self.db["property_stats"].exists():
+                        self.build_property_stats()
+                elif incremental:
+                    self.db = self.instrumentation.connect(self.db_file)
+                    self.update_properties(self.instrumentation.progress(entities))
+                else:
+                    self.build_properties(
+                        self.instrumentation.progress(entities), fill_names=True
+                    )
+        except Exception as e:
+            raise ROCrateTabulatorException(f"Crate load failed: {e}")
+        if not graph.has_graph:
+            raise ROCrateTabulatorException("Crate load failed: No @graph in json-ld")
+        self.crate.context = graph.top.get("@context")
+        self.write_context()
         return self.db
 
+    def crates_to_db(self, crates, db_file, jobs=1, stream=False, indexes=True):
+        """Load a batch of (crate_id, crate_uri), such as find_crates
+        returns, into one database. Each crate is loaded into a database of
+        its own by build_crate, which also builds any tables in self.cf,
+        in a pool of jobs worker processes. This process merges them as they
+        finish, adding a crate_id column to every table. Crates which fail to
+        load are recorded in the batch_crate table and skipped.
+
+        Junctions which the workers add to the config are combined. Returns
+        a dict of the properties found for each table in all the crates. The
+        crates aren't kept in memory, so terms are resolved with the first
+        crate's @context, as in stream mode. With a single job, the crates
+        are built one at a time in this process."""
+        self.crate_dir = None
+        self.db_file = db_file
+        self.indexes = indexes
+        self.incremental = False
+        self.stream = True
+        self.entity_names = {}
+        self.fetch_expanded.cache_clear()
+        self.terms = {}
+        self.db = self.instrumentation.connect(db_file, recreate=True)
+        self.db["batch_crate"].create(BATCH_CRATES, pk=CRATE_ID)
+        # the workers plan each crate's tables from this config as it is now,
+        # not as it is after earlier crates' junctions have been merged in
+        state = self.worker_state(stream=stream)
+        allprops = {}
+        n = 0
+        seconds = 0.0
+        tmp = tempfile.TemporaryDirectory(dir=Path(db_file).parent)
+        items = [
+            (crate_id, crate_uri, Path(tmp.name) / f"{i}.db")
+            for i, (crate_id, crate_uri) in enumerate(crates)
+        ]
+        worker = partial(build_crate, state)
+        pool = ProcessPoolExecutor(jobs) if jobs > 1 else nullcontext()
+        with tmp, pool:
+            if jobs > 1:
+                results = bounded_map(pool, worker, items, window=jobs * 2)
+            else:
+                results = map(worker, items)
+            for (crate_id, crate_uri, out_file), result in zip(items, results):
+                cf, crate_props, load_stats, metrics, error = result
+                self.instrumentation.merge(metrics)
+                rows = load_stats["rows"] if load_stats else None
+                self.db["batch_crate"].insert(
+                    {
+                        "crate_id": crate_id,
+                        "crate_uri": crate_uri,
+                        "rows": rows,
+                        "seconds": load_stats["seconds"] if load_stats else None,
+                        "error": error,
+                    }
+                )
+                if error is not None:
+                    continue
+                n += rows
+                seconds += load_stats["seconds"]
+                self.merge_tables(out_file, crate_id=crate_id)
+                out_file.unlink()
+                for table, props in crate_props.items():
+                    allprops.setdefault(table, set()).update(props)
+                    junctions = self.cf["tables"][table].setdefault("junctions", [])
+                    for label in cf["tables"][table].get("junctions", []):
+                        if label not in junctions:
+                            junctions.append(label)
+        for table in allprops:
+            self.build_fts(table)
+        if not self.db["property"].exists():
+            self.db["property"].create({CRATE_ID: str, **PROPERTIES})
+        if self.indexes:
+            self.create_indexes()
+        self.build_property_stats()
+        self.crate = TinyCrate({"@context": self.read_context(), "@graph": []})
+        self.load_stats = {
+            "rows": n,
+            "seconds": seconds,
+            "rows_per_sec": n / seconds if seconds else 0.0,
+        }
+        return allprops
+
+    def write_context(self):
+        """Store the crate's @context in the crate_context table"""
+        table = self.db["crate_context"]
+        table.create(CRATE_CONTEXT, replace=True)
+        table.insert({"context": json.dumps(self.crate.context)})
+
+    def read_context(self):
+        """Return the @context stored by write_context, or None if there
+        isn't one"""
+        if not self.db["crate_context"].exists():
+            return None
+        row = self.db.execute("SELECT context FROM crate_context").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _can_update(self, db_file):
+        """Check whether db_file has what's needed for an incremental
+        build"""
+        if not Path(db_file).is_file():
+            return False
+        db = self.instrumentation.connect(db_file)
+        can_update = (
+            db["property"].exists()
+            and db["entity_hash"].exists()
+            and "name" in db["entity_hash"].columns_dict
+        )
+        db.close()
+        return can_update
+
+    def build_properties(self, entities, fill_names=False):
+        """Create a new database and write the property rows and hashes for
+        a sequence of entities"""
+        self.db = self.instrumentation.connect(self.db_file, recreate=True)
+        self.db["property"].create(PROPERTIES)
+        self.db["entity_hash"].create(ENTITY_HASHES, pk="entity_id")
+        with self.bulk_load():
+            hashes = []
+            self.write_properties(self._property_rows(entities, hashes), hashes)
+            if fill_names:
+                self.fill_relation_names()
+            if self.indexes:
+                self.create_indexes()
+        self.build_property_stats()
+
+    def update_properties(self, entities):
+        """Compare the hash of each entity with the one stored by the last
+        build, and replace the property rows of entities which have been
+        added, changed or removed. The ids of those entities, and of any
+        entities with relations to them, are written to the dirty_entity
+        table, and entity_table will only rebuild their rows.
+
+        The entities are read in one pass, writing the new rows of each
+        changed entity as it is found, so only ids and hashes are kept in
+        memory. The rows which these replace are deleted afterwards."""
+        with self.instrumentation.phase("update_properties") as record:
+            conn = self.db.conn
+            old = dict(conn.execute("SELECT entity_id, hash FROM entity_hash"))
+            with self.bulk_load():
+                conn.execute("DROP TABLE IF EXISTS dirty_entity")
+                conn.execute("CREATE TABLE dirty_entity (entity_id TEXT PRIMARY KEY)")
+                start = conn.execute(
+                    "SELECT COALESCE(MAX(CAST(row_id AS INTEGER)) + 1, 0) FROM property"
+                ).fetchone()[0]
+                hashes = []
+                changed = self._changed_entities(entities, old)
+                self.write_properties(
+                    self._property_rows(changed, hashes, start), hashes
+                )
+                # the entities left in old have been removed
+                removed = [(eid,) for eid in old]
+                conn.executemany(
+                    "INSERT OR IGNORE INTO dirty_entity VALUES (?)", removed
+                )
+                conn.executemany("DELETE FROM entity_hash WHERE entity_id = ?", removed)
+                conn.execute(
+                    "DELETE FROM property WHERE CAST(row_id AS INTEGER) < ? "
+                    "AND source_id IN (SELECT entity_id FROM dirty_entity)",
+                    [start],
+                )
+                record["rows"] = conn.execute(
+                    "SELECT COUNT(*) FROM dirty_entity"
+                ).fetchone()[0]
+                # relations to or from the changed entities need their names
+                # updating
+                conn.execute("""
+                    UPDATE property
+                    SET value = CASE
+                        WHEN EXISTS (
+                            SELECT 1 FROM entity_hash h
+                            WHERE h.entity_id = property.target_id
+                        ) THEN (
+                            SELECT h.name FROM entity_hash h
+                            WHERE h.entity_id = property.target_id
+                        )
+                        ELSE '' END
+                    WHERE target_id IS NOT NULL AND (
+                        target_id IN (SELECT entity_id FROM dirty_entity)
+                        OR source_id IN (SELECT entity_id FROM dirty_entity)
+                    )
+                """)
+                conn.execute("""
+                    INSERT OR IGNORE INTO dirty_entity
+                    SELECT DISTINCT source_id FROM property
+                    WHERE target_id IN (SELECT entity_id FROM dirty_entity)
+                """)
+                if self.indexes:
+                    self.create_indexes()
+            self.build_property_stats()
+            self.incremental = True
+
+    def _changed_entities(self, entities, old):
+        """Yields the entities whose hash isn't the one in old, a dict of
+        entity_id -> hash, and adds their ids to dirty_entity. The ids of
+        all the entities are popped from old, leaving those which have been
+        removed."""
+        for e in entities:
+            eid = e["@id"]
+            if eid is not None and old.pop(eid, None) != entity_hash(e.props):
+                self.db.conn.execute(
+                    "INSERT OR IGNORE INTO dirty_entity VALUES (?)", [eid]
+                )
+                yield e
+
+    def _property_rows(self, entities, hashes=None, start=0):
+        """Returns a generator which yields numbered property rows for a
+        sequence of entities, starting at row_id start. If hashes is a list,
+        (entity_id, hash, name) is appended to it for each entity"""
+        row_ids = count(start)
+        for e in entities:
+            if hashes is not None and e["@id"] is not None:
+                name = sql_value(e.props.get("name"))
+                hashes.append((e["@id"], entity_hash(e.props), name))
+            yield from self.entity_properties(e, row_ids)
+
+    @contextmanager
+    def bulk_load(self):
+        """Context manager which switches the database to BULK_LOAD_PRAGMAS
+        and a single transaction, restoring the previous settings when
+        done"""
+        conn = self.db.conn
+        if conn.in_transaction:
+            conn.commit()
+        saved = {
+            pragma: conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+            for pragma in BULK_LOAD_PRAGMAS
+        }
+        for pragma, value in BULK_LOAD_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        try:
+            conn.execute("BEGIN")
+            yield self.db
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            for pragma, value in saved.items():
+                conn.execute(f"PRAGMA {pragma} = {value}")
+
+    def write_properties(self, rows, hashes=None):
+        """Write property row tuples to the database in chunks of
+        self.batch_size with a prepared INSERT. If hashes is a list which is
+        being filled by the rows generator, its contents are written to
+        entity_hash after each chunk. Sets self.load_stats to the number of
+        rows, elapsed time and rows per second."""
+        with self.instrumentation.phase("write_properties") as record:
+            columns = list(PROPERTIES)
+            sql = "INSERT INTO property ({}) VALUES ({})".format(
+                ", ".join(columns), ", ".join("?" for _ in columns)
+            )
+            start = time.perf_counter()
+            n = 0
+            rows = iter(rows)
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+                self.db.conn.executemany(sql, batch)
+                n += len(batch)
+                if hashes:
+                    self.write_hashes(hashes)
+            if hashes:
+                self.write_hashes(hashes)
+            seconds = time.perf_counter() - start
+            record["rows"] = n
+            self.load_stats = {
+                "rows": n,
+                "seconds": seconds,
+                "rows_per_sec": n / seconds if seconds else 0.0,
+            }
+            return self.load_stats
+
+    def create_indexes(self):
+        """Create PROPERTY_INDEXES if they don't already exist"""
+        with self.instrumentation.phase("create_indexes"):
+            for name, columns in PROPERTY_INDEXES.items():
+                cols = ", ".join(columns)
+                self.db.conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {name} ON property ({cols})"
+                )
+
+    def build_property_stats(self):
+        """(Re)build the property_stats table with one aggregate query over
+        the property table, so that planning and config inference don't
+        have to scan it again"""
+        with self.instrumentation.phase("property_stats") as record:
+            # entities in different crates of a batch can have the same id
+            batch = CRATE_ID in self.db["property"].columns_dict
+            crate = CRATE_ID if batch else "NULL"
+            table = self.db["property_stats"]
+            table.create(
+                PROPERTY_STATS, pk=("entity_type", "property_label"), replace=True
+            )
+            with self.db.conn:
+                self.db.conn.execute(
+                    """
+                    INSERT INTO property_stats ({0})
+                    WITH typed AS (
+                        SELECT DISTINCT value AS entity_type, source_id,
+                            {crate} AS crate_id
+                        FROM property
+                        WHERE property_label = '@type'
+                    ), counts AS (
+                        SELECT t.entity_type, p.property_label,
+                            COUNT(*) AS n_values, COUNT(p.target_id) AS n_targets,
+                            MIN(p.rowid) AS pos
+                        FROM typed t
+                        JOIN property p ON p.source_id = t.source_id
+                            AND {p_crate} IS t.crate_id
+                        GROUP BY t.entity_type, t.crate_id, p.source_id,
+                            p.property_label
+                    ), targets AS (
+                        SELECT entity_type, property_label, COUNT(*) AS n
+                        FROM (
+                            SELECT DISTINCT t.entity_type, p.property_label,
+                                t.crate_id, p.target_id
+                            FROM typed t
+                            JOIN property p ON p.source_id = t.source_id
+                                AND {p_crate} IS t.crate_id
+                            WHERE p.target_id IS NOT NULL
+                        )
+                        GROUP BY entity_type, property_label
+                    )
+                    SELECT c.entity_type, c.property_label, COUNT(*),
+                        MAX(n_values), MAX(n_targets),
+                        CAST(SUM(n_targets) AS REAL) / SUM(n_values),
+                        COALESCE(MIN(t.n), 0), MIN(pos)
+                    FROM counts c
+                    LEFT JOIN targets t USING (entity_type, property_label)
+                    GROUP BY c.entity_type, c.property_label
+                    """.format(
+                        ", ".join(PROPERTY_STATS),
+                        crate=crate,
+                        p_crate=f"p.{crate}" if batch else crate,
+                    )
+                )
+            record["rows"] = table.count
+
+    def write_hashes(self, hashes):
+        """Write a list of (entity_id, hash, name) to entity_hash and empty
+        it"""
+        self.db.conn.executemany(
+            "INSERT OR REPLACE INTO entity_hash VALUES (?, ?, ?)", hashes
+        )
+        hashes.clear()
+
+    def fill_relation_names(self):
+        """Set the value of each relation row to the name of its target, for
+        property tables which were built without the crate in memory. The
+        names come from entity_hash, which has them as index_names does"""
+        with self.instrumentation.phase("fill_relation_names"):
+            self.db.conn.execute("""
+                UPDATE property
+                    SET value = (
+                        SELECT name FROM entity_hash
+                        WHERE entity_id = property.target_id
+                    )
+                    WHERE target_id IN (SELECT entity_id FROM entity_hash)
+            """)
+
+    def write_metrics(self, metrics_file):
+        """Record the cache statistics with the instrumentation and write
+        its metrics to a JSON file"""
+        self.record_caches()
+        self.instrumentation.write(metrics_file)
+
+    def record_caches(self):
+        """Record the statistics of the expansion, terms and http caches
+        with the instrumentation"""
+        cache = self.fetch_expanded.cache_info()
+        self.instrumentation.cache(
+            "expansion",
+            hits=cache.hits,
+            misses=cache.misses,
+            maxsize=cache.maxsize,
+            currsize=cache.currsize,
+        )
+        self.instrumentation.cache("terms", currsize=len(self.terms))
+        if self.http_cache is not None:
+            self.instrumentation.cache("http", **self.http_cache.stats)
+
     def close(self):
         """Close the connection to the SQLite database - for Windows users"""
         self.db.close()
 
     def dump_structure(self):
-        """Testing getting metadata about relations from the database"""
-        # get all types
-
-        for t in self.fetch_types():
-            print(f"@type: {t}")
-            query = """
-    SELECT p.source_id, p.property_label, count(p.target_id) as n_links
-    FROM property as p
-    WHERE p.source_id IN (
-        SELECT p.source_id
-        FROM property p
-        WHERE p.property_label = '@type' AND p.value = ?
-        )
-    GROUP BY p.source_id, p.property_label
-    ORDER BY n_links desc
-    LIMIT 1
-    """
-            summary = self.db.query(query, [t])
-            for row in summary:
-                if row["n_links"] > 0:
+        """Print the properties of each type with relations, with the most
+        relations any one entity has for them"""
+        for attype, stats in groupby(
+            self.fetch_property_stats(), key=itemgetter("entity_type")
+        ):
+            print(f"@type: {attype}")
+            stats = sorted(stats, key=itemgetter("max_targets"), reverse=True)
+            for row in stats:
+                if row["max_targets"] > 0:
                     print(
-                        row["source_id"]
-                        + "."
-                        + row["property_label"]
-                        + ": "
-                        + str(row["n_links"])
+                        f"{attype}.{row['property_label']}: {row['max_targets']} "
+                        f"({row['entities']} entities, "
+                        f"{row['distinct_targets']} targets)"
                     )
 
     def _load_crate(self, crate_uri):
-        if crate_uri[:4] == "http":
-            response = requests.get(crate_uri)
-            return response.json()
-        with open(
-            Path(crate_uri) / "ro-crate-metadata.json", "r", encoding="utf-8"
-        ) as jfh:
+        with self._open_crate(crate_uri) as jfh:
             return json.load(jfh)
 
-    def entity_properties(self, e):
-        """Returns a generator which yields all of this entity's rows"""
+    def _open_crate(self, crate_uri):
+        """Open the crate's JSON-LD as a text stream without reading it. If
+        self.http_cache is set, remote crates are opened from the cache"""
+        if crate_uri[:4] == "http":
+            if self.http_cache is not None:
+                path = self.http_cache.fetch(crate_uri)
+                return open(path, "r", encoding="utf-8")
+            response = self.session.get(crate_uri, stream=True)
+            response.raise_for_status()
+            response.raw.decode_content = True
+            return io.TextIOWrapper(response.raw, encoding="utf-8")
+        return open(Path(crate_uri) / "ro-crate-metadata.json", "r", encoding="utf-8")
+
+    def entity_properties(self, e, row_ids=None):
+        """Returns a generator which yields all of this entity's rows as
+        tuples in the order of PROPERTIES, numbered by the iterator row_ids"""
         eid = e["@id"]
         if eid is None:
             return
-        ename = e["name"]
+        if row_ids is None:
+            row_ids = count()
+        eid = sql_value(eid)
+        ename = sql_value(e["name"])
         for key, value in e.props.items():
             if key != "@id":
                 for v in get_as_list(value):
                     maybe_id = get_as_id(v)
                     if maybe_id is not None:
-                        yield self.relation_row(eid, ename, key, maybe_id)
+                        yield self.relation_row(
+                            next(row_ids), eid, ename, key, maybe_id
+                        )
                     else:
-                        yield self.property_row(eid, ename, key, v)
-
-    def relation_row(self, eid, ename, prop, tid):
-        """Return a row representing a relation between two entities"""
-        target_name = ""
-        target = self.crate.get(tid)
-        if target:
-            target_name = target["name"]
-        return {
-            "source_id": eid,
-            "source_name": ename,
-            "property_label": prop,
-            "target_id": tid,
-            "value": target_name,
+                        yield self.property_row(next(row_ids), eid, ename, key, v)
+
+    def index_names(self):
+        """Build the id -> name index of the crate's entities used by
+        relation_row, in one pass over the graph"""
+        self.entity_names = {
+            e["@id"]: sql_value(e.get("name")) for e in self.crate.graph if "@id" in e
         }
 
-    def property_row(self, eid, ename, prop, value):
+    def relation_row(self, row_id, eid, ename, prop, tid):
+        """Return a row representing a relation between two entities. The
+        value is the target's name, or "" if it isn't in the crate"""
+        return (
+            row_id,
+            eid,
+            ename,
+            prop,
+            sql_value(tid),
+            self.entity_names.get(tid, ""),
+        )
+
+    def property_row(self, row_id, eid, ename, prop, value):
         """Return a row representing a property"""
+        return (row_id, eid, ename, prop, None, sql_value(value))
+
+    def worker_state(self, **state):
+        """Returns the settings which from_state needs to make a tabulator
+        like this one in a worker process, with a copy of the config as it
+        is now, and anything in state added"""
         return {
-            "source_id": eid,
-            "source_name": ename,
-            "property_label": prop,
-            "value": value,
+            "db_file": None if self.db_file is None else str(self.db_file),
+            "crate_dir": self.crate_dir,
+            "cf": copy.deepcopy(self.cf),
+            "text_prop": self.text_prop,
+            "text_workers": self.text_workers,
+            "text_max_bytes": self.text_max_bytes,
+            "batch_size": self.batch_size,
+            "engine": self.engine,
+            "trace_sql": self.instrumentation.trace_sql,
+            "expansion_cache_size": self.fetch_expanded.cache_info().maxsize,
+            "http_cache": (
+                None if self.http_cache is None else str(self.http_cache.cache_dir)
+            ),
+            **state,
         }
 
-    def entity_table(self, table):
+    @classmethod
+    def from_state(cls, state):
+        """Make a tabulator from worker_state in a worker process, with its
+        own copy of the config and no progress bars. Its tables' full-text
+        indexes are left to the process which merges them."""
+        tb = cls(
+            expansion_cache_size=state["expansion_cache_size"],
+            instrumentation=Instrumentation(
+                progress=False, trace_sql=state["trace_sql"]
+            ),
+        )
+        tb.cf = copy.deepcopy(state["cf"])
+        tb.crate_dir = state["crate_dir"]
+        tb.text_prop = state["text_prop"]
+        tb.text_workers = state["text_workers"]
+        tb.text_max_bytes = state["text_max_bytes"]
+        tb.batch_size = state["batch_size"]
+        tb.engine = state["engine"]
+        tb.fts = False
+        if state["http_cache"] is not None:
+            tb.http_cache = HTTPCache(state["http_cache"], tb.session)
+        return tb
+
+    def entity_tables(self, tables, jobs=1):
+        """Build several entity tables, yielding (table, allprops) for each
+        one in order. If jobs > 1 the tables are built by a pool of worker
+        processes, each reading the property table and writing to its own
+        database, and then merged into this database."""
+        if jobs <= 1:
+            for table in tables:
+                yield table, self.entity_table(table)
+            return
+        state = self.worker_state()
+        tmp = tempfile.TemporaryDirectory(dir=Path(self.db_file).parent)
+        with tmp, ProcessPoolExecutor(jobs) as pool:
+            futures = []
+            dirty = []
+            for i, table in enumerate(tables):
+                dirty_only = self.incremental and self.db[table].exists()
+                if dirty_only:
+                    self.delete_dirty(table)
+                else:
+                    self.delete_text_failures(table)
+                dirty.append(dirty_only)
+                out_file = Path(tmp.name) / f"{i}.db"
+                futures.append(
+                    pool.submit(build_entity_table, state, table, out_file, dirty_only)
+                )
+            # workers hold read locks on this database until they're done
+            results = [future.result() for future in futures]
+            for table, dirty_only, (table_cf, allprops, out_file, metrics) in zip(
+                tables, dirty, results
+            ):
+                self.cf["tables"][table] = table_cf
+                self.instrumentation.merge(metrics)
+                self.merge_tables(out_file)
+                self.build_fts(table, dirty_only)
+                yield table, allprops
+
+    def merge_tables(self, db_file, crate_id=None):
+        """Copy all the tables from another database into this one, creating
+        them or adding columns as needed, and replacing rows with the same
+        primary key. If crate_id is given, each row is tagged with it in a
+        crate_id column, which is added to the front of the primary key, and
+        property_stats is left for build_property_stats to redo."""
+        with self.instrumentation.phase("merge_tables", db_file=str(db_file)):
+            conn = self.db.conn
+            conn.execute("ATTACH DATABASE ? AS merge", [str(db_file)])
+            try:
+                with conn:
+                    tables = conn.execute(
+                        "SELECT name, sql FROM merge.sqlite_master WHERE type = 'table'"
+                    ).fetchall()
+                    for name, sql in tables:
+                        if crate_id is not None and name == "property_stats":
+                            continue
+                        info = conn.execute(
+                            f"PRAGMA merge.table_info([{name}])"
+                        ).fetchall()
+                        columns = [row[1] for row in info]
+                        if not self.db[name].exists():
+                            if crate_id is not None:
+                                sql = crate_table_sql(name, info)
+                            conn.execute(sql)
+                        else:
+                            existing = set(self.db[name].columns_dict)
+                            for column in columns:
+                                if column not in existing:
+                                    self.db[name].add_column(column, str)
+                        cols = ", ".join(f"[{c}]" for c in columns)
+                        into, select, params = cols, cols, []
+                        if crate_id is not None:
+                            into = f"[{CRATE_ID}], {cols}"
+                            select = f"?, {cols}"
+                            params = [crate_id]
+                        conn.execute(
+                            f"INSERT OR REPLACE INTO main.[{name}] ({into}) "
+                            f"SELECT {select} FROM merge.[{name}]",
+                            params,
+                        )
+            finally:
+                conn.execute("DETACH DATABASE merge")
+
+    def entity_table(self, table, dirty_only=None):
         """Build a db table for one type of entity. Returns a set() of all
-        the properties found during the build"""
-        self.entity_table_plan(table)
-        entities = []
-        allprops = set()
-        for entity_id in tqdm(list(self.fetch_ids(table))):
+        the properties found during the build.
+
+        If dirty_only is True, only the rows for entities in dirty_entity
+        are deleted and rebuilt. By default this is done if the property
+        table was updated incrementally and the table already exists."""
+        with self.instrumentation.phase("entity_table", table=table) as record:
+            if dirty_only is None:
+                dirty_only = self.incremental and self.db[table].exists()
+            self.entity_table_plan(table)
+            if dirty_only:
+                self.delete_dirty(table)
+            else:
+                self.delete_text_failures(table)
+            junctions = self.junction_tables(table)
+            specs = self.column_specs(table)
+            columns = self.create_entity_table(table, specs)
+            allprops = set()
+            if dirty_only:
+                allprops.update(self.cf["tables"][table].get("all_props", []))
+            if self.engine == "sql" and can_pivot(specs):
+                texts, n = self.pivot_entities(table, specs, allprops, dirty_only)
+            else:
+                texts, n = self.build_entities(
+                    table, columns, junctions, allprops, dirty_only
+                )
+            if texts:
+                self.load_texts(table, texts)
+            if self.fts:
+                self.build_fts(table, dirty_only)
+            record["rows"] = n
+            return allprops
+
+    def build_entities(self, table, columns, junctions, allprops, dirty_only):
+        """Python engine for entity_table: build each entity's row with an
+        EntityRecord and write the rows and junctions in batches. Adds the
+        properties found to allprops and returns the list of texts to load
+        and the number of entities"""
+        rows = []
+        texts = []
+        n = 0
+        progress = self.instrumentation.progress
+        for entity_id, properties in progress(self.fetch_entities(table, dirty_only)):
+            n += 1
             entity = EntityRecord(tabulator=self, table=table, entity_id=entity_id)
-            props = entity.build(self.fetch_properties(entity_id))
+            props = entity.build(properties)
             allprops.update(props)
-            entities.append(entity.data)
+            rows.append(entity.data)
+            if entity.text_target is not None:
+                texts.append((entity_id, entity.text_target))
+            if len(rows) >= self.batch_size:
+                columns = self.write_entities(table, columns, rows)
             for prop, target_ids in entity.junctions.items():
-                jtable = f"{table}_{prop}"
-                seq = 0
-                for target_id in target_ids:
-                    self.db[jtable].insert(
-                        {
-                            "seq": seq,
-                            "entity_id": entity_id,
-                            "target_id": target_id,
-                        },
-                        pk=("entity_id", "target_id"),
-                        replace=True,
-                        alter=True,
+                jrows = junctions[prop]
+                for seq, target_id in enumerate(target_ids):
+                    jrows.append((seq, entity_id, target_id))
+                if len(jrows) >= self.batch_size:
+                    self.write_junctions(f"{table}_{prop}", jrows)
+        for prop, jrows in junctions.items():
+            self.write_junctions(f"{table}_{prop}", jrows)
+        self.write_entities(table, columns, rows)
+        return texts, n
+
+    def pivot_entities(self, table, specs, allprops, dirty_only):
+        """SQL engine for entity_table: number each entity's values with
+        window functions and pivot them into the entity table with one
+        INSERT ... SELECT, so that Python never touches a row. Gives the
+        same results as build_entities, as long as can_pivot(specs).
+        Adds the properties found to allprops and returns the list of texts
+        to load and the number of entities"""
+        cf = self.cf["tables"][table]
+        expand = cf.get("expand_props", [])
+        ignore = cf.get("ignore_props", [])
+        # configs from before property_stats can list a junction twice
+        junctions = dict.fromkeys(cf.get("junctions", []))
+        text_prop = self.text_prop
+        dirty = ""
+        if dirty_only:
+            dirty = "AND source_id IN (SELECT entity_id FROM dirty_entity)"
+        conn = self.db.conn
+        with conn:
+            conn.execute("DROP TABLE IF EXISTS temp.pivot_entity")
+            conn.execute("DROP TABLE IF EXISTS temp.pivot_cell")
+            conn.execute(
+                f"""
+                CREATE TEMP TABLE pivot_entity AS
+                SELECT DISTINCT source_id FROM property
+                WHERE property_label = '@type' AND value = ? {dirty}
+                ORDER BY source_id
+                """,
+                [table],
+            )
+            # properties in expand_props are replaced by their targets'
+            # properties, as in EntityRecord.add_expanded_property
+            conn.execute(
+                f"""
+                CREATE TEMP TABLE pivot_cell AS
+                WITH cell AS (
+                    SELECT p.source_id, p.property_label AS label, p.value,
+                        p.target_id, p.rowid AS pos, 0 AS sub
+                    FROM temp.pivot_entity e
+                    JOIN property p ON p.source_id = e.source_id
+                    WHERE NOT (
+                            p.property_label IN ({placeholders(expand)})
+                            AND p.target_id IS NOT NULL
+                            AND p.property_label IS NOT ?
+                        )
+                    UNION ALL
+                    SELECT p.source_id, p.property_label || '_' || t.property_label,
+                        t.value, t.target_id, p.rowid, t.rowid
+                    FROM temp.pivot_entity e
+                    JOIN property p ON p.source_id = e.source_id
+                    JOIN property t ON t.source_id = p.target_id
+                    WHERE p.property_label IN ({placeholders(expand)})
+                        AND p.property_label IS NOT ?
+                )
+                SELECT source_id, label, value, target_id,
+                    ROW_NUMBER() OVER w - 1 AS n,
+                    CASE WHEN target_id IS NOT NULL THEN ROW_NUMBER() OVER (
+                        PARTITION BY source_id, label, target_id IS NULL
+                        ORDER BY pos, sub
+                    ) - 1 END AS tn,
+                    COUNT(*) OVER (PARTITION BY source_id, label) - 1 AS last
+                FROM cell
+                WINDOW w AS (PARTITION BY source_id, label ORDER BY pos, sub)
+                """,
+                [*expand, text_prop, *expand, text_prop],
+            )
+            conn.execute(
+                "CREATE INDEX temp.pivot_cell_source ON pivot_cell (source_id)"
+            )
+            allprops.update(
+                row[0]
+                for row in conn.execute(
+                    f"""
+                    SELECT DISTINCT label FROM temp.pivot_cell
+                    UNION
+                    SELECT DISTINCT property_label FROM property
+                    WHERE source_id IN temp.pivot_entity
+                        AND property_label IN ({placeholders(expand)})
+                    """,
+                    expand,
+                )
+            )
+            conn.execute(
+                f"""
+                DELETE FROM temp.pivot_cell
+                WHERE label IN ({placeholders(ignore)}) AND label IS NOT ?
+                """,
+                [*ignore, text_prop],
+            )
+            selects = []
+            params = []
+            for column, label, kind, i in specs[1:]:
+                if kind == "text":
+                    selects.append(
+                        "MAX(CASE WHEN c.label = ? AND c.n = c.last "
+                        "AND c.target_id IS NULL THEN c.value END)"
                     )
-                    seq += 1
-        self.db[table].insert_all(entities, pk="entity_id", replace=True, alter=True)
-        return allprops
+                    params.append(label)
+                elif kind == "target":
+                    selects.append(
+                        "MAX(CASE WHEN c.label = ? AND c.tn = ? THEN c.target_id END)"
+                    )
+                    params.extend([label, i])
+                else:
+                    selects.append(
+                        "MAX(CASE WHEN c.label = ? AND c.n = ? THEN c.value END)"
+                    )
+                    params.extend([label, i])
+            conn.execute(
+                "INSERT OR REPLACE INTO [{}] ({}) SELECT {} FROM temp.pivot_entity e "
+                "LEFT JOIN temp.pivot_cell c ON c.source_id = e.source_id "
+                "GROUP BY e.source_id ORDER BY e.source_id".format(
+                    table,
+                    ", ".join(f"[{spec[0]}]" for spec in specs),
+                    ", ".join(["e.source_id"] + selects),
+                ),
+                params,
+            )
+            for prop in junctions:
+                conn.execute(
+                    "INSERT OR REPLACE INTO [{}] ({}) "
+                    "SELECT n, source_id, target_id FROM temp.pivot_cell "
+                    "WHERE label = ? ORDER BY source_id, n".format(
+                        f"{table}_{prop}", ", ".join(JUNCTION_COLUMNS)
+                    ),
+                    [prop],
+                )
+            texts = conn.execute(
+                """
+                SELECT source_id, target_id FROM temp.pivot_cell
+                WHERE label = ? AND n = last AND target_id IS NOT NULL
+                ORDER BY source_id
+                """,
+                [text_prop],
+            ).fetchall()
+            n = conn.execute("SELECT COUNT(*) FROM temp.pivot_entity").fetchone()[0]
+            conn.execute("DROP TABLE temp.pivot_cell")
+            conn.execute("DROP TABLE temp.pivot_entity")
+        return texts, n
+
+    def load_texts(self, table, texts):
+        """Load the text_prop files for a list of (entity_id, target_id) and
+        write them into the entity table. Files are read by a pool of
+        self.text_workers threads, and written in batches of twice that many,
+        so that only a few files are in memory at a time. Files which can't
+        be loaded get a 'load failed' message in the table and are recorded
+        in the text_failure table."""
+        with self.instrumentation.phase("load_texts", table=table) as record:
+            sql = f"UPDATE [{table}] SET [{self.text_prop}] = ? WHERE entity_id = ?"
+            window = self.text_workers * 2
+            updates = []
+            failures = []
+            progress = self.instrumentation.progress
+            with ThreadPoolExecutor(self.text_workers) as pool:
+                results = bounded_map(pool, self._load_text, texts, window=window)
+                for (entity_id, target_id), (text, error) in progress(
+                    zip(texts, results), total=len(texts)
+                ):
+                    if error is not None:
+                        failures.append((table, entity_id, target_id, error))
+                        text = f"load failed: {error}"
+                    updates.append((text, entity_id))
+                    if len(updates) >= window:
+                        with self.db.conn:
+                            self.db.conn.executemany(sql, updates)
+                        updates.clear()
+            with self.db.conn:
+                self.db.conn.executemany(sql, updates)
+            if failures:
+                self.db["text_failure"].insert_all(
+                    [dict(zip(TEXT_FAILURES, failure)) for failure in failures],
+                    columns=TEXT_FAILURES,
+                )
+            record["rows"] = len(texts)
+            record["failures"] = len(failures)
+            return failures
+
+    def _load_text(self, text):
+        """Load one (entity_id, target_id) for load_texts, returning (text,
+        error)"""
+        try:
+            return self.fetch_text(text[1]), None
+        except ROCrateTabulatorException as e:
+            return None, str(e)
+
+    def fetch_text(self, target_id):
+        """Return the contents of a file in the crate or a URL as text,
+        raising a ROCrateTabulatorException if it's bigger than
+        self.text_max_bytes or can't be read"""
+        max_bytes = self.text_max_bytes
+        if target_id[:4] != "http" and str(self.crate_dir)[:4] == "http":
+            target_id = urljoin(self.crate_dir, target_id)
+        if target_id[:4] == "http":
+            try:
+                with self.session.get(target_id, stream=True) as response:
+                    response.raise_for_status()
+                    too_large = ROCrateTabulatorException(
+                        f"{target_id} is larger than {max_bytes} bytes"
+                    )
+                    length = response.headers.get("Content-Length", "")
+                    if max_bytes is not None and length.isdigit():
+                        if int(length) > max_bytes:
+                            raise too_large
+                    content = bytearray()
+                    for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                        content += chunk
+                        if max_bytes is not None and len(content) > max_bytes:
+                            raise too_large
+                    # requests assumes ISO-8859-1 for text without a charset
+                    encoding = "utf-8"
+                    if "charset" in response.headers.get("Content-Type", ""):
+                        encoding = response.encoding
+                    return content.decode(encoding)
+            except (requests.RequestException, UnicodeDecodeError) as e:
+                raise ROCrateTabulatorException(f"http request failed: {e}")
+        path = Path(self.crate_dir) / unquote(target_id)
+        try:
+            if max_bytes is not None and path.stat().st_size > max_bytes:
+                raise ROCrateTabulatorException(
+                    f"{target_id} is larger than {max_bytes} bytes"
+                )
+            with open(path, "r", encoding="utf-8") as fh:
+                return fh.read()
+        except (OSError, UnicodeDecodeError) as e:
+            raise ROCrateTabulatorException(f"File read failed: {e}")
+
+    def delete_dirty(self, table):
+        """Delete the rows for entities in dirty_entity from an entity table
+        and its junction and text_failure tables"""
+        junctions = self.cf["tables"][table].get("junctions", [])
+        fts = self.db[f"{table}_fts"]
+        with self.db.conn:
+            if fts.exists() and self.db[table].exists():
+                # an external-content index needs the old values to remove
+                # a row
+                cols = ", ".join(f"[{c}]" for c in fts.columns_dict)
+                self.db.conn.execute(
+                    f"INSERT INTO [{fts.name}] ([{fts.name}], rowid, {cols}) "
+                    f"SELECT 'delete', rowid, {cols} FROM [{table}] "
+                    "WHERE entity_id IN (SELECT entity_id FROM dirty_entity)"
+                )
+            for name in [table] + [f"{table}_{prop}" for prop in junctions]:
+                if self.db[name].exists():
+                    self.db.conn.execute(
+                        f"DELETE FROM [{name}] "
+                        "WHERE entity_id IN (SELECT entity_id FROM dirty_entity)"
+                    )
+            if self.db["text_failure"].exists():
+                self.db.conn.execute(
+                    "DELETE FROM text_failure WHERE entity_table = ? "
+                    "AND entity_id IN (SELECT entity_id FROM dirty_entity)",
+                    [table],
+                )
+
+    def delete_text_failures(self, table):
+        """Delete an entity table's rows from text_failure before it is
+        built in full"""
+        if self.db["text_failure"].exists():
+            with self.db.conn:
+                self.db.conn.execute(
+                    "DELETE FROM text_failure WHERE entity_table = ?", [table]
+                )
+
+    def fts_columns(self, table):
+        """The columns of an entity table to index for full-text search:
+        those in its fts_columns config which it has"""
+        existing = self.db[table].columns_dict
+        configured = self.cf["tables"][table].get("fts_columns", [])
+        return [c for c in dict.fromkeys(configured) if c in existing]
+
+    def build_fts(self, table, dirty_only=False):
+        """Index an entity table's fts_columns in {table}_fts, an FTS5 table
+        which reads their contents from the entity table. If dirty_only is
+        True and the index has the same columns, only the rows for entities
+        in dirty_entity are added - delete_dirty has taken their old values
+        out - otherwise the index is rebuilt. The index is dropped if there
+        are no columns to index."""
+        fts = self.db[f"{table}_fts"]
+        columns = self.fts_columns(table)
+        if not columns:
+            if fts.exists():
+                fts.drop()
+            return
+        with self.instrumentation.phase("build_fts", table=table) as record:
+            cols = ", ".join(f"[{c}]" for c in columns)
+            conn = self.db.conn
+            with conn:
+                if dirty_only and fts.exists() and list(fts.columns_dict) == columns:
+                    cursor = conn.execute(
+                        f"INSERT INTO [{fts.name}] (rowid, {cols}) "
+                        f"SELECT rowid, {cols} FROM [{table}] "
+                        "WHERE entity_id IN (SELECT entity_id FROM dirty_entity)"
+                    )
+                    record["rows"] = cursor.rowcount
+                else:
+                    content = table.replace("'", "''")
+                    conn.execute(f"DROP TABLE IF EXISTS [{fts.name}]")
+                    conn.execute(
+                        f"CREATE VIRTUAL TABLE [{fts.name}] USING fts5({cols}, "
+                        f"content='{content}', content_rowid='rowid')"
+                    )
+                    conn.execute(
+                        f"INSERT INTO [{fts.name}] ([{fts.name}]) VALUES ('rebuild')"
+                    )
+                    record["rows"] = self.db[table].count
+
+    def column_specs(self, table):
+        """Work out the columns that EntityRecord.build will produce for a
+        table from the property multiplicity stats, in the order in which
+        the properties first appear in the crate. Returns (column, label,
+        kind, i) for each column, where kind is "text" for text_prop,
+        "value" for the ith value of a property and "target" for the ith
+        target of its relations, so a property which some entity has three
+        values for gets columns prop, prop_1 and prop_2, and the same for
+        prop_id if its values are relations. Columns can appear more than
+        once."""
+        cf = self.cf["tables"][table]
+        expand_props = cf.get("expand_props", [])
+        ignore_props = cf.get("ignore_props", [])
+        junctions = cf.get("junctions", [])
+        specs = [("entity_id", None, "id", 0)]
+        for stats in self.fetch_multiplicity(table, expand_props):
+            label = stats["label"]
+            if label == self.text_prop:
+                specs.append((label, label, "text", 0))
+                continue
+            if label in ignore_props or label in junctions:
+                continue
+            for i in range(max(stats["n_values"], stats["n_targets"])):
+                if i < stats["n_values"]:
+                    specs.append((numbered_column(label, i), label, "value", i))
+                if i < stats["n_targets"]:
+                    specs.append(
+                        (numbered_column(f"{label}_id", i), label, "target", i)
+                    )
+        return specs
+
+    def create_entity_table(self, table, specs=None):
+        """Create an entity table with its precomputed columns, or add any
+        which are missing if it already exists. Returns the columns"""
+        if specs is None:
+            specs = self.column_specs(table)
+        columns = unique_columns(specs)
+        if self.db[table].exists():
+            existing = set(self.db[table].columns_dict)
+            for column in columns:
+                if column not in existing:
+                    self.db[table].add_column(column, str)
+        else:
+            self.db[table].create({c: str for c in columns}, pk="entity_id")
+        return columns
+
+    def write_entities(self, table, columns, rows):
+        """Insert a batch of entity rows and empty the batch. Rows with an
+        unplanned column - which shouldn't happen - cause the column to be
+        added. Returns the columns, including any which were added."""
+        if not rows:
+            return columns
+        known = set(columns)
+        for row in rows:
+            for column in row:
+                if column not in known:
+                    self.db[table].add_column(column, str)
+                    columns.append(column)
+                    known.add(column)
+        sql = "INSERT OR REPLACE INTO [{}] ({}) VALUES ({})".format(
+            table,
+            ", ".join(f"[{c}]" for c in columns),
+            ", ".join("?" for _ in columns),
+        )
+        with self.db.conn:
+            self.db.conn.executemany(
+                sql, ([sql_value(row.get(c)) for c in columns] for row in rows)
+            )
+        rows.clear()
+        return columns
+
+    def junction_tables(self, table):
+        """Create the junction tables for an entity table if they don't
+        exist, and return a dict of empty row buffers by property"""
+        junctions = {}
+        for prop in self.cf["tables"][table]["junctions"]:
+            self.db[f"{table}_{prop}"].create(
+                JUNCTION_COLUMNS, pk=("entity_id", "target_id"), if_not_exists=True
+            )
+            junctions[prop] = []
+        return junctions
+
+    def write_junctions(self, jtable, jrows):
+        """Insert a batch of (seq, entity_id, target_id) rows into a junction
+        table and empty the batch"""
+        if not jrows:
+            return
+        sql = "INSERT OR REPLACE INTO [{}] ({}) VALUES (?, ?, ?)".format(
+            jtable, ", ".join(JUNCTION_COLUMNS)
+        )
+        with self.db.conn:
+            self.db.conn.executemany(sql, jrows)
+        jrows.clear()
 
     def entity_table_plan(self, table):
         """Check entity relations to see if any need to be done as a junction
         table to avoid huge numbers of expanded columns"""
         if "junctions" not in self.cf["tables"][table]:
             self.cf["tables"][table]["junctions"] = []
-        for prop_counts in self.fetch_relation_counts(table):
-            if prop_counts["n_links"] > MAX_NUMBERED_COLS:
-                label = prop_counts["property_label"]
+        junctions = self.cf["tables"][table]["junctions"]
+        for stats in self.fetch_property_stats(table):
+            label = stats["property_label"]
+            if stats["max_targets"] > MAX_NUMBERED_COLS and label not in junctions:
                 print(f"{table}.{label} > {MAX_NUMBERED_COLS} relations")
-                self.cf["tables"][table]["junctions"].append(label)
+                junctions.append(label)
 
     # Some helper methods for wrapping SQLite statements
 
@@ -408,12 +2002,113 @@ class ROCrateTabulator:
             SELECT property_label, value, target_id
             FROM property
             WHERE source_id = ?
+            ORDER BY rowid
             """,
             [entity_id],
         )
         for prop in properties:
             yield prop
 
+    def fetch_entities(self, entity_type, dirty_only=False):
+        """return a generator which yields (entity_id, properties) for every
+        entity of this type, reading all of their properties in one query.
+        If dirty_only is True, only entities in dirty_entity are returned"""
+        dirty = ""
+        if dirty_only:
+            dirty = "AND source_id IN (SELECT entity_id FROM dirty_entity)"
+        rows = self.db.query(
+            f"""
+            SELECT source_id, property_label, value, target_id
+            FROM property
+            WHERE source_id IN (
+                SELECT source_id
+                FROM property
+                WHERE property_label = '@type' AND value = ?
+                {dirty}
+            )
+            ORDER BY source_id, rowid
+            """,
+            [entity_type],
+        )
+        yield from groupby(rows, key=itemgetter("source_id"))
+
+    def _fetch_expanded(self, target_id):
+        """return a tuple of the properties for a target of expand_props -
+        called through the self.fetch_expanded cache"""
+        return tuple(self.fetch_properties(target_id))
+
+    def fetch_multiplicity(self, entity_type, expand_props=()):
+        """return, for each property label of entities of this type, the
+        largest number of values and of relations that any one entity has,
+        in order of first appearance. Properties in expand_props are
+        replaced by the labels of their targets' properties, prefixed with
+        the property name"""
+        if not expand_props:
+            return (
+                {
+                    "label": row["property_label"],
+                    "n_values": row["max_values"],
+                    "n_targets": row["max_targets"],
+                }
+                for row in self.fetch_property_stats(entity_type)
+            )
+        expand = ", ".join("?" for _ in expand_props)
+        query = f"""
+    WITH entity AS (
+        SELECT source_id
+        FROM property
+        WHERE property_label = '@type' AND value = ?
+    ), cell AS (
+        SELECT p.source_id, p.property_label AS label, p.target_id,
+            p.rowid AS pos, 0 AS sub
+        FROM property p
+        WHERE p.source_id IN entity
+            AND NOT (p.property_label IN ({expand}) AND p.target_id IS NOT NULL)
+        UNION ALL
+        SELECT p.source_id, p.property_label || '_' || t.property_label,
+            t.target_id, p.rowid, t.rowid
+        FROM property p
+        JOIN property t ON t.source_id = p.target_id
+        WHERE p.source_id IN entity AND p.property_label IN ({expand})
+    ), counts AS (
+        SELECT label, COUNT(*) AS n_values, COUNT(target_id) AS n_targets,
+            MIN(pos) AS pos, MIN(sub) AS sub
+        FROM cell
+        GROUP BY source_id, label
+    )
+    SELECT label, MAX(n_values) AS n_values, MAX(n_targets) AS n_targets
+    FROM counts
+    GROUP BY label
+    ORDER BY MIN(pos), MIN(sub)
+    """
+        return self.db.query(query, [entity_type, *expand_props, *expand_props])
+
+    def fetch_matches(self, table, query, limit=None):
+        """return a generator which yields the rows of an entity table which
+        match an FTS5 query on its fts_columns, best matches first"""
+        fts = f"{table}_fts"
+        sql = (
+            f"SELECT t.* FROM [{fts}] JOIN [{table}] t ON t.rowid = [{fts}].rowid "
+            f"WHERE [{fts}] MATCH ? ORDER BY rank"
+        )
+        params = [query]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        yield from self.db.query(sql, params)
+
+    def fetch_property_stats(self, entity_type=None):
+        """return the property_stats rows for a type, or for all types, in
+        the order in which the properties first appear"""
+        if entity_type is None:
+            return self.db.query(
+                "SELECT * FROM property_stats ORDER BY entity_type, position"
+            )
+        return self.db.query(
+            "SELECT * FROM property_stats WHERE entity_type = ? ORDER BY position",
+            [entity_type],
+        )
+
     def fetch_relation_counts(self, t):
         query = """
     SELECT p.source_id, p.property_label, count(p.target_id) as n_links
@@ -428,8 +2123,14 @@ class ROCrateTabulator:
     """
         return self.db.query(query, [t])
 
-    def export_csv(self, rocrate_dir):
-        """Export csvs as configured"""
+    def export_csv(self, rocrate_dir, jobs=1):
+        """Export csvs as configured. Each entry in export_queries is either
+        a query or a dict with a "query" and optionally a "format" ("csv" or
+        "jsonl") and "compression" ("gzip" or "xz"), otherwise taken from
+        the filename, eg "table.jsonl.gz". If jobs > 1, the export queries are run
+        by a pool of threads, each with its own read-only connection to the
+        database. The CSVW schemas are added in the configured order once
+        all of the files have been written."""
 
         queries = self.cf["export_queries"]
         # print("Global props", self.global_props)
@@ -439,90 +2140,399 @@ class ROCrateTabulator:
         if rocrate_dir is not None:
             Path(rocrate_dir).mkdir(parents=True, exist_ok=True)
         files = []
-
-        for csv_filename, query in queries.items():
+        exports = []
+        for csv_filename, spec in queries.items():
             files.append({"@id": csv_filename})
-            result = list(self.db.query(query))
-            # Convert result into a CSV file using csv writer
             csv_path = csv_filename
             if rocrate_dir is not None:
                 csv_path = Path(rocrate_dir) / csv_filename
-            with open(csv_path, "w", newline="") as csvfile:
-                writer = csv.DictWriter(
-                    csvfile, fieldnames=result[0].keys(), quoting=csv.QUOTE_MINIMAL
-                )
-                writer.writeheader()
-                # Check if the key is a string and replace newlines
-
-                keys = set()
-
-                for row in result:
-                    for key, value in row.items():
-                        if isinstance(value, str):
-                            row[key] = value.replace("\n", "\\n").replace("\r", "\\r")
-                        keys.add(key)
-                    writer.writerow(row)
-
-            # add the schema to the CSV
-            schema_id = "#SCHEMA_" + csv_filename
-            schema_props = {
-                "name": "CSVW Table schema for: " + csv_filename,
-                "columns": [],
+            query, fmt, compression = export_format(csv_filename, spec)
+            exports.append((query, csv_path, fmt, compression))
+
+        if jobs > 1:
+            # the readers open the database file, so they need to see
+            # everything this connection has written
+            if self.db.conn.in_transaction:
+                self.db.conn.commit()
+            with ThreadPoolExecutor(jobs) as pool:
+                results = list(pool.map(self._export_read_only, exports))
+        else:
+            results = [self._export(export) for export in exports]
+
+        self.export_stats = {}
+        for csv_filename, export, (columns, n, seconds) in zip(
+            queries, exports, results
+        ):
+            query, csv_path, fmt, compression = export
+            self.export_stats[csv_filename] = {
+                "path": str(csv_path),
+                "format": fmt,
+                "compression": compression,
+                "rows": n,
+                "seconds": seconds,
             }
-            for key in keys:
-                base_prop = re.sub(r".*_", "", key)
-                column_props = {
-                    "name": key,
-                    "label": base_prop,
-                }
-                uri = self.crate.resolve_term(base_prop)
-
-                if uri:
-                    column_props["propertyUrl"] = uri
-                    definition = self.crate.get(uri)
-                    if definition:
-                        print("definition", definition["rdfs:comment"])
-                        column_props["description"] = definition["rdfs:comment"]
-                # TODO -- look up local definitions and add a description
-                col_id = "#COLUMN_" + csv_filename + "_" + key
-                self.schemaCrate.add("csvw:Column", col_id, column_props)
-                schema_props["columns"].append({"@id": col_id})
-
-            self.schemaCrate.add(
-                ["File", "csvw:Table"],
-                csv_filename,
-                {
-                    "tableSchema": {"@id": schema_id},
-                    "name": "Generated export from RO-Crate: " + csv_filename,
-                },
-            )
-            self.schemaCrate.add("csvw:Schema", schema_id, schema_props)
-
-            print(f"Exported {csv_filename} to {csv_path}")
+            self.add_csv_schema(csv_filename, columns, fmt, compression)
 
         root_entity = self.schemaCrate.root()
         root_entity["hasPart"] = files
         root_entity["name"] = "CSV exported from RO-Crate"
         self.schemaCrate.write_json(rocrate_dir)
 
+    def _export(self, export, conn=None):
+        """Run one (query, path, format, compression) export, returning the
+        columns, number of rows and time taken"""
+        query, path, fmt, compression = export
+        with self.instrumentation.phase("export", path=str(path)) as record:
+            if fmt == "jsonl":
+                columns, n = self.write_jsonl(query, path, compression, conn)
+            else:
+                columns, n = self.write_csv(query, path, compression, conn)
+            record["rows"] = n
+        return columns, n, record["seconds"]
+
+    def _export_read_only(self, export):
+        """Run an export on a new read-only connection. The database is
+        opened as immutable, so that SQLite doesn't take any locks, which is
+        safe because nothing writes to it during an export."""
+        uri = Path(self.db_file).resolve().as_uri() + "?mode=ro&immutable=1"
+        conn = self.instrumentation.connection(uri, uri=True)
+        try:
+            return self._export(export, conn)
+        finally:
+            conn.close()
+
+    def write_csv(self, query, csv_path, compression=None, conn=None):
+        """Stream the results of a query into a CSV file, escaping newlines
+        and compressing it if compression is "gzip" or "xz". Uses conn if
+        it's given, or else this tabulator's connection. Returns the column
+        names and the number of rows written"""
+        if conn is None:
+            conn = self.db.conn
+        cursor = conn.execute(query)
+        columns = [d[0] for d in cursor.description]
+        n = 0
+        with open_export(csv_path, compression) as csvfile:
+            writer = csv.writer(csvfile, quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(columns)
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                writer.writerows(
+                    [
+                        v.replace("\n", "\\n").replace("\r", "\\r")
+                        if isinstance(v, str)
+                        else v
+                        for v in row
+                    ]
+                    for row in rows
+                )
+                n += len(rows)
+        return columns, n
+
+    def write_jsonl(self, query, jsonl_path, compression=None, conn=None):
+        """Stream the results of a query into a JSON Lines file, one object
+        per row, like write_csv. Blobs are base64 encoded, and the query's
+        columns must have unique names, as they become the objects' keys"""
+        if conn is None:
+            conn = self.db.conn
+        cursor = conn.execute(query)
+        columns = [d[0] for d in cursor.description]
+        duplicates = sorted({c for c in columns if columns.count(c) > 1})
+        if duplicates:
+            raise ROCrateTabulatorException(
+                f"Duplicate columns in JSON Lines export {jsonl_path}: "
+                + ", ".join(duplicates)
+            )
+        n = 0
+        with open_export(jsonl_path, compression) as jsonlfile:
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                jsonlfile.writelines(
+                    json.dumps(
+                        dict(zip(columns, row)), ensure_ascii=False, default=jsonl_value
+                    )
+                    + "\n"
+                    for row in rows
+                )
+                n += len(rows)
+        return columns, n
+
+    def add_csv_schema(self, csv_filename, columns, fmt="csv", compression=None):
+        """Add a CSVW schema for an exported file to the schemaCrate. The
+        file's encodingFormat is its media type, preceded by the compression's
+        if it's compressed"""
+        schema_id = "#SCHEMA_" + csv_filename
+        schema_props = {
+            "name": "CSVW Table schema for: " + csv_filename,
+            "columns": [],
+        }
+        for key in columns:
+            base_prop = key.rpartition("_")[2]
+            column_props = {
+                "name": key,
+                "label": base_prop,
+            }
+            uri, description = self.resolve_column_term(base_prop)
+            if uri:
+                column_props["propertyUrl"] = uri
+                if description:
+                    column_props["description"] = description
+            # TODO -- look up local definitions and add a description
+            col_id = "#COLUMN_" + csv_filename + "_" + key
+            self.schemaCrate.add("csvw:Column", col_id, column_props)
+            schema_props["columns"].append({"@id": col_id})
+
+        media_types = [EXPORT_MEDIA_TYPES[f] for f in (compression, fmt) if f]
+        self.schemaCrate.add(
+            ["File", "csvw:Table"],
+            csv_filename,
+            {
+                "tableSchema": {"@id": schema_id},
+                "name": "Generated export from RO-Crate: " + csv_filename,
+                "encodingFormat": media_types[0]
+                if len(media_types) == 1
+                else media_types,
+            },
+        )
+        self.schemaCrate.add("csvw:Schema", schema_id, schema_props)
+
+    def resolve_column_term(self, term):
+        """Return the IRI of a column's base term and the description of
+        its definition in the crate, if any. Results are cached in
+        self.terms, as numbered and expanded columns share their terms."""
+        if term not in self.terms:
+            uri = self.crate.resolve_term(term)
+            description = None
+            if uri and self.stream:
+                description = self.fetch_comment(uri)
+            elif uri:
+                definition = self.crate.get(uri)
+                if definition:
+                    description = definition["rdfs:comment"]
+            self.terms[term] = (uri, description)
+        return self.terms[term]
+
+    def fetch_comment(self, entity_id):
+        """Return an entity's rdfs:comment from the property table, as a
+        list if it has more than one"""
+        comments = [
+            row[0]
+            for row in self.db.execute(
+                """
+                SELECT value FROM property
+                WHERE source_id = ? AND property_label = 'rdfs:comment'
+                ORDER BY rowid
+                """,
+                [entity_id],
+            )
+        ]
+        if len(comments) > 1:
+            return comments
+        return comments[0] if comments else None
+
     def find_csv(self):
+        """Return the ids of the crate's CSV files"""
         files = self.db.query("""
         SELECT source_id
         FROM property
         WHERE property_label = '@type' AND value = 'File' AND LOWER(source_id) LIKE '%.csv'
     """)
-        for entity_id in [row["source_id"] for row in files]:
-            entity_id = entity_id.replace("#", "")
-            self.add_csv(self.crate_dir / entity_id, "csv_files")
+        return [row["source_id"] for row in files]
+
+    def find_csv_contents(self, table_name=CSV_TABLE, jobs=1):
+        """Concatenate the crate's CSV files into one table with
+        concat_csv"""
+        if self.crate_dir is None or str(self.crate_dir)[:4] == "http":
+            raise ROCrateTabulatorException(
+                "CSV files can only be concatenated from a local crate"
+            )
+        csv_files = [
+            (entity_id, Path(self.crate_dir) / unquote(entity_id.replace("#", "")))
+            for entity_id in self.find_csv()
+        ]
+        return self.concat_csv(csv_files, table_name, jobs)
 
     def add_csv(self, csv_path, table_name):
-        with open(csv_path, newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            rows = list(reader)
-            if rows:
-                # Insert rows into the table (the table will be created if it doesn't exist)
-                self.db[table_name].insert_all(rows, pk="id", alter=True, ignore=True)
-            # `pk="id"` assumes there's an 'id' column; if no primary key, you can remove it.
+        """Load one CSV file into a table, as concat_csv does"""
+        return self.concat_csv([(Path(csv_path).name, csv_path)], table_name)
+
+    def concat_csv(self, csv_files, table_name=CSV_TABLE, jobs=1):
+        """Stream a list of (source_file, path) CSV files into one table,
+        with the union of their columns, which is planned from their headers
+        first, and each row's source_file and source_row. Rows are written in
+        chunks of self.batch_size, so no file is read into memory. If jobs
+        > 1, the files are parsed by a pool of worker processes, each
+        writing to its own database, which are merged into this one.
+
+        Returns {"rows", "error"} for each source_file: files which can't be
+        read are skipped. Any rows already loaded from these files are
+        replaced."""
+        with self.instrumentation.phase("concat_csv", table=table_name) as record:
+            results = {}
+            headers = {}
+            for source_file, path in csv_files:
+                try:
+                    headers[source_file] = csv_header(path)
+                except (OSError, UnicodeDecodeError, csv.Error) as e:
+                    results[source_file] = {"rows": 0, "error": str(e)}
+            columns = list(CSV_SOURCE)
+            for column in dict.fromkeys(chain.from_iterable(headers.values())):
+                if column not in CSV_SOURCE:
+                    columns.append(column)
+            self.create_csv_table(table_name, columns)
+            with self.db.conn:
+                self.db.conn.execute(
+                    f"DELETE FROM [{table_name}] "
+                    f"WHERE source_file IN ({placeholders(headers)})",
+                    list(headers),
+                )
+            items = [
+                (source_file, str(path))
+                for source_file, path in csv_files
+                if source_file in headers
+            ]
+            if jobs <= 1:
+                for source_file, path in items:
+                    results[source_file] = self.load_csv(
+                        table_name, columns, source_file, path
+                    )
+            else:
+                results.update(self._concat_csv_jobs(table_name, columns, items, jobs))
+            record["rows"] = sum(result["rows"] for result in results.values())
+            return results
+
+    def _concat_csv_jobs(self, table_name, columns, items, jobs):
+        """Load (source_file, path) items with load_csv_file in a pool of
+        worker processes, merging their databases as they finish"""
+        state = self.worker_state(table=table_name, columns=columns)
+        results = {}
+        tmp = tempfile.TemporaryDirectory(dir=Path(self.db_file).parent)
+        items = [
+            (source_file, path, Path(tmp.name) / f"{i}.db")
+            for i, (source_file, path) in enumerate(items)
+        ]
+        worker = partial(load_csv_file, state)
+        with tmp, ProcessPoolExecutor(jobs) as pool:
+            loaded = bounded_map(pool, worker, items, window=jobs * 2)
+            for (source_file, path, out_file), (result, metrics) in zip(items, loaded):
+                self.instrumentation.merge(metrics)
+                if result["error"] is None:
+                    self.merge_tables(out_file)
+                out_file.unlink(missing_ok=True)
+                results[source_file] = result
+        return results
+
+    def create_csv_table(self, table_name, columns):
+        """Create the table for concat_csv, or add any columns which are
+        missing if it already exists"""
+        table = self.db[table_name]
+        if table.exists():
+            existing = set(table.columns_dict)
+            for column in columns:
+                if column not in existing:
+                    table.add_column(column, str)
+        else:
+            table.create(
+                {c: CSV_SOURCE.get(c, str) for c in columns}, pk=tuple(CSV_SOURCE)
+            )
+
+    def load_csv(self, table_name, columns, source_file, path):
+        """Stream one CSV file into a table with the given columns, in chunks
+        of self.batch_size rows. Columns of the file named like CSV_SOURCE are
+        dropped. Returns {"rows", "error"}: if the file can't be read, any
+        rows written are deleted again and the error is returned."""
+        index = {c: i for i, c in enumerate(columns) if c not in CSV_SOURCE}
+        sql = "INSERT OR REPLACE INTO [{}] ({}) VALUES ({})".format(
+            table_name,
+            ", ".join(f"[{c}]" for c in columns),
+            placeholders(columns),
+        )
+        n = 0
+        try:
+            with open(path, newline="", encoding="utf-8") as fh:
+                reader = csv.reader(fh)
+                positions = [index.get(column) for column in next(reader, [])]
+                while True:
+                    chunk = []
+                    for values in islice(reader, self.batch_size):
+                        row = [None] * len(columns)
+                        row[0] = source_file
+                        row[1] = n + len(chunk) + 1
+                        for i, value in zip(positions, values):
+                            if i is not None:
+                                row[i] = value
+                        chunk.append(row)
+                    if not chunk:
+                        break
+                    with self.db.conn:
+                        self.db.conn.executemany(sql, chunk)
+                    n += len(chunk)
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            with self.db.conn:
+                self.db.conn.execute(
+                    f"DELETE FROM [{table_name}] WHERE source_file = ?", [source_file]
+                )
+            return {"rows": 0, "error": str(e)}
+        return {"rows": n, "error": None}
+
+
+def build_entity_table(state, table, out_file, dirty_only=False):
+    """Worker for ROCrateTabulator.entity_tables: build one entity table and
+    its junctions in out_file, reading the property table from the database
+    in state. If dirty_only is True, only the rows for entities in
+    dirty_entity are built. Returns the table's updated config, its allprops,
+    out_file and the worker's metrics, including its expansion cache's"""
+    tb = ROCrateTabulator.from_state(state)
+    tb.db_file = out_file
+    tb.db = tb.instrumentation.connect(out_file, recreate=True)
+    tb.db.conn.execute("ATTACH DATABASE ? AS crate", [state["db_file"]])
+    allprops = tb.entity_table(table, dirty_only)
+    tb.close()
+    tb.record_caches()
+    return tb.cf["tables"][table], allprops, out_file, tb.instrumentation.to_dict()
+
+
+def build_crate(state, crate):
+    """Worker for ROCrateTabulator.crates_to_db: load one (crate_id,
+    crate_uri, out_file) into out_file and build the tables in the config
+    in state, if there is one. Returns the updated config, the properties
+    found for each table, the load stats, the worker's metrics and None, or
+    if the crate couldn't be loaded, an error message in place of None."""
+    crate_id, crate_uri, out_file = crate
+    # from_state copies the config, so that when crates are built in-process
+    # one crate's junctions don't change the next one's plan
+    tb = ROCrateTabulator.from_state(state)
+    allprops = {}
+    try:
+        tb.crate_to_db(crate_uri, out_file, stream=state["stream"])
+        if tb.cf is not None:
+            for table in tb.cf["tables"]:
+                allprops[table] = tb.entity_table(table)
+    except ROCrateTabulatorException as e:
+        tb.record_caches()
+        return None, allprops, None, tb.instrumentation.to_dict(), str(e)
+    finally:
+        if tb.db is not None:
+            tb.close()
+    tb.record_caches()
+    return tb.cf, allprops, tb.load_stats, tb.instrumentation.to_dict(), None
+
+
+def load_csv_file(state, item):
+    """Worker for ROCrateTabulator.concat_csv: stream one (source_file, path,
+    out_file) into a table in out_file. Returns the result of load_csv and
+    the worker's metrics"""
+    source_file, path, out_file = item
+    tb = ROCrateTabulator.from_state(state)
+    tb.db_file = out_file
+    tb.db = tb.instrumentation.connect(out_file, recreate=True)
+    tb.create_csv_table(state["table"], state["columns"])
+    result = tb.load_csv(state["table"], state["columns"], source_file, path)
+    tb.close()
+    return result, tb.instrumentation.to_dict()
 
 
 # Style guide: all print() output should be in the section below this -
@@ -535,7 +2545,8 @@ def parse_args(arg_list=None):
     ap.add_argument(
         "crate",
         type=str,
-        help="Input RO-Crate URL or directory",
+        help="Input RO-Crate URL or directory, or with --batch, a directory "
+        "of crates or a file listing them",
     )
     ap.add_argument(
         "output",
@@ -554,7 +2565,19 @@ def parse_args(arg_list=None):
         "--text",
         default=None,
         type=str,
-        help="Entities of this type will be loaded as text into the database",
+        help="Targets of this property will be loaded as text into the database",
+    )
+    ap.add_argument(
+        "--text-workers",
+        default=TEXT_WORKERS,
+        type=int,
+        help="Number of threads used to load text",
+    )
+    ap.add_argument(
+        "--text-max-bytes",
+        default=TEXT_MAX_BYTES,
+        type=int,
+        help="Files larger than this won't be loaded as text",
     )
     ap.add_argument(
         "--concat",
@@ -566,6 +2589,68 @@ def parse_args(arg_list=None):
         action="store_true",
         help="Force rebuild of the database",
     )
+    ap.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only update the rows for entities which have changed since the "
+        "database was built",
+    )
+    ap.add_argument(
+        "--batch",
+        action="store_true",
+        help="Load a batch of crates into one database, with a crate_id "
+        "column, using --jobs worker processes",
+    )
+    ap.add_argument(
+        "--http-cache",
+        default=None,
+        type=Path,
+        help="Directory in which to cache crates fetched over http",
+    )
+    ap.add_argument(
+        "--engine",
+        default="python",
+        choices=["python", "sql"],
+        help="Build entity tables row by row in Python, or pivot them in SQLite",
+    )
+    ap.add_argument(
+        "--metrics",
+        default=None,
+        type=Path,
+        help="Write a JSON profile of the phases, SQL and caches to this file",
+    )
+    ap.add_argument(
+        "--stream",
+        action="store_true",
+        help="Parse the crate one entity at a time and look things up in the "
+        "database rather than keeping the crate in memory",
+    )
+    ap.add_argument(
+        "--batch-size",
+        default=BATCH_SIZE,
+        type=int,
+        help="Number of rows written or read at a time when building the "
+        "property, entity and junction tables, loading CSV files and exporting",
+    )
+    ap.add_argument(
+        "--no-indexes",
+        action="store_true",
+        help="Don't index the properties table",
+    )
+    ap.add_argument(
+        "--expansion-cache",
+        default=EXPANSION_CACHE_SIZE,
+        type=int,
+        help="Number of expanded entities to cache while building tables",
+    )
+    ap.add_argument(
+        "-j",
+        "--jobs",
+        default=1,
+        type=int,
+        help="Number of entity tables to build, and of export queries to "
+        "run, in parallel",
+    )
     ap.add_argument(
         "--structure",
         action="store_true",
@@ -575,31 +2660,91 @@ def parse_args(arg_list=None):
 
 
 def main(args):
-    tb = ROCrateTabulator()
+    instrumentation = Instrumentation(trace_sql=args.metrics is not None)
+    tb = ROCrateTabulator(
+        expansion_cache_size=args.expansion_cache, instrumentation=instrumentation
+    )
+    tb.batch_size = args.batch_size
+    if args.http_cache is not None:
+        tb.http_cache = HTTPCache(args.http_cache, tb.session)
+
+    tb.text_prop = args.text
+    tb.engine = args.engine
+    tb.text_workers = args.text_workers
+    tb.text_max_bytes = args.text_max_bytes
+    if args.config.is_file():
+        print(f"Loading config from {args.config}")
+        tb.read_config(args.config)
 
-    if Path(args.output).is_file() and not args.rebuild:
+    batch_props = None
+    if args.batch:
+        if args.incremental or args.concat:
+            sys.exit("--incremental and --concat can't be used with --batch")
+        crates = find_crates(args.crate)
+        print(f"Building properties table from {len(crates)} crates")
+        batch_props = tb.crates_to_db(
+            crates,
+            args.output,
+            jobs=args.jobs,
+            stream=args.stream,
+            indexes=not args.no_indexes,
+        )
+        stats = tb.load_stats
+        print(
+            f"Loaded {stats['rows']} properties in {stats['seconds']:.2f}s "
+            f"({stats['rows_per_sec']:.0f} rows/sec)"
+        )
+        for row in tb.db.query("SELECT * FROM batch_crate WHERE error IS NOT NULL"):
+            print(f"Failed to load {row['crate_id']}: {row['error']}")
+    elif Path(args.output).is_file() and not (args.rebuild or args.incremental):
         print("Loading properties table")
-        tb.crate_to_db(args.crate, args.output, rebuild=False)
+        tb.crate_to_db(
+            args.crate,
+            args.output,
+            rebuild=False,
+            stream=args.stream,
+            indexes=not args.no_indexes,
+        )
     else:
         print("Building properties table")
-        tb.crate_to_db(args.crate, args.output)
+        tb.crate_to_db(
+            args.crate,
+            args.output,
+            stream=args.stream,
+            indexes=not args.no_indexes,
+            incremental=args.incremental,
+        )
+        stats = tb.load_stats
+        print(
+            f"Loaded {stats['rows']} properties in {stats['seconds']:.2f}s "
+            f"({stats['rows_per_sec']:.0f} rows/sec)"
+        )
+        if tb.incremental:
+            print(f"{tb.db['dirty_entity'].count} entities to update")
 
     if args.structure:
         tb.dump_structure()
         sys.exit()
 
-    if args.config.is_file():
-        print(f"Loading config from {args.config}")
-        tb.read_config(args.config)
-    else:
+    if tb.cf is None:
         print(f"Config {args.config} not found - generating default")
         tb.infer_config()
 
-    tb.text_prop = args.text
-    for table in tb.cf["tables"]:
-        print(f"Building entity table for {table}")
-        allprops = tb.entity_table(table)
-        tb.cf["tables"][table]["all_props"] = list(allprops)
+    if batch_props is not None:
+        for table, allprops in batch_props.items():
+            print(f"Built entity table for {table}")
+            tb.cf["tables"][table]["all_props"] = list(allprops)
+    else:
+        tables = list(tb.cf["tables"])
+        if args.jobs > 1:
+            print(f"Building {len(tables)} entity tables with {args.jobs} jobs")
+        for table, allprops in tb.entity_tables(tables, jobs=args.jobs):
+            print(f"Built entity table for {table}")
+            tb.cf["tables"][table]["all_props"] = list(allprops)
+    tb.record_caches()
+    cache = tb.instrumentation.caches["expansion"]
+    if cache["hits"] or cache["misses"]:
+        print(f"Expansion cache: {cache['hits']} hits, {cache['misses']} misses")
 
     tb.write_config(args.config)
     print(f"""
@@ -607,9 +2752,21 @@ Updated config file: {args.config}, edit this file to change the flattening conf
 """)
 
     if args.concat:
-        tb.find_csv_contents()
+        for source_file, result in tb.find_csv_contents(jobs=args.jobs).items():
+            if result["error"] is not None:
+                print(f"Couldn't load {source_file}: {result['error']}")
+            else:
+                print(f"Loaded {result['rows']} rows from {source_file}")
 
-    tb.export_csv(args.csv)
+    tb.export_csv(args.csv, jobs=args.jobs)
+    for csv_filename, stats in tb.export_stats.items():
+        print(
+            f"Exported {stats['rows']} rows to {stats['path']} "
+            f"in {stats['seconds']:.2f}s"
+        )
+    if args.metrics is not None:
+        tb.write_metrics(args.metrics)
+        print(f"Wrote metrics to {args.metrics}")
 
 
 def cli():
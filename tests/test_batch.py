@@ -0,0 +1,132 @@
+from collections import Counter
+from pathlib import Path
+from rocrate_tabular.tabulator import (
+    ROCrateTabulator,
+    ROCrateTabulatorException,
+    find_crates,
+)
+import copy
+import pytest
+import shutil
+from util import tabulate
+
+
+def rows(db, table, crate_id=None):
+    """A table's rows without their crate_id or empty columns, which can
+    come from other crates, sorted"""
+    where = "" if crate_id is None else "WHERE crate_id = ?"
+    params = [] if crate_id is None else [crate_id]
+    result = []
+    for row in db.query(f"SELECT * FROM [{table}] {where}", params):
+        row.pop("crate_id", None)
+        result.append(
+            tuple(sorted((k, str(v)) for k, v in row.items() if v is not None))
+        )
+    return sorted(result)
+
+
+def test_find_crates(crates, tmp_path):
+    batch = Path(tmp_path) / "batch"
+    shutil.copytree(crates["minimal"], batch / "one")
+    shutil.copytree(crates["wide"], batch / "nested" / "two")
+    assert find_crates(batch) == [
+        ("nested/two", str(batch / "nested" / "two")),
+        ("one", str(batch / "one")),
+    ]
+    manifest = batch / "crates.txt"
+    manifest.write_text("# crates\none\n\nhttp://example.com/crate\n")
+    assert find_crates(manifest) == [
+        ("one", str(batch / "one")),
+        ("http://example.com/crate", "http://example.com/crate"),
+    ]
+    manifest.write_text("one\none\n")
+    with pytest.raises(ROCrateTabulatorException):
+        find_crates(manifest)
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_batch_matches(crates, tmp_path, jobs):
+    """Each crate's rows in a batch database are the rows it gets on its
+    own, even when crates share entity ids"""
+    tb = tabulate(crates["languageFamily"], Path(tmp_path) / "config.db")
+    tb.close()
+    cf = tb.cf
+    batch = [
+        ("family", crates["languageFamily"]),
+        ("wide", crates["wide"]),
+        ("family_again", crates["languageFamily"]),
+    ]
+    tb = ROCrateTabulator()
+    tb.cf = copy.deepcopy(cf)
+    allprops = tb.crates_to_db(batch, Path(tmp_path) / "batch.db", jobs=jobs)
+    assert set(allprops) == set(cf["tables"])
+    assert tb.db["RepositoryObject"].pks == ["crate_id", "entity_id"]
+    entities = Counter()
+    for i, (crate_id, crate_dir) in enumerate(batch):
+        single = ROCrateTabulator()
+        single.crate_to_db(crate_dir, Path(tmp_path) / f"{i}.db")
+        single.cf = copy.deepcopy(cf)
+        for table in cf["tables"]:
+            single.entity_table(table)
+        for table in single.db.table_names():
+            if table in ["property_stats", "crate_context"]:
+                continue
+            assert rows(tb.db, table, crate_id) == rows(single.db, table), table
+        for row in single.fetch_property_stats():
+            entities[row["entity_type"], row["property_label"]] += row["entities"]
+        single.close()
+    # property_stats counts entities with the same id in each crate
+    assert entities == {
+        (row["entity_type"], row["property_label"]): row["entities"]
+        for row in tb.fetch_property_stats()
+    }
+    assert tb.load_stats["rows"] == tb.db["property"].count
+    tb.close()
+
+
+def test_batch_failure(crates, tmp_path):
+    """A crate which can't be loaded is recorded and the rest are merged"""
+    tb = ROCrateTabulator()
+    tb.crates_to_db(
+        [("missing", str(Path(tmp_path) / "missing")), ("minimal", crates["minimal"])],
+        Path(tmp_path) / "batch.db",
+    )
+    loaded = {row["crate_id"]: row for row in tb.db["batch_crate"].rows}
+    assert "Crate load failed" in loaded["missing"]["error"]
+    assert loaded["minimal"]["error"] is None
+    assert loaded["minimal"]["rows"] == tb.db["property"].count
+    tb.infer_config()
+    assert "Dataset" in tb.cf["potential_tables"]
+
+
+def test_batch_order(crates, tmp_path):
+    """Each crate's tables are planned from its own copy of the config, so
+    neither the order of the crates nor the number of jobs changes them"""
+    tb = tabulate(crates["wide"], Path(tmp_path) / "config.db", ["Dataset"])
+    tb.close()
+    cf = tb.cf
+    batch = [("wide", crates["wide"]), ("textfiles", crates["textfiles"])]
+    outputs = []
+    for i, (order, jobs) in enumerate(
+        [(batch, 1), (batch, 2), (batch[::-1], 1), (batch[::-1], 2)]
+    ):
+        tb = ROCrateTabulator()
+        tb.cf = copy.deepcopy(cf)
+        tb.crates_to_db(order, Path(tmp_path) / f"batch{i}.db", jobs=jobs)
+        tables = [
+            t
+            for t in tb.db.table_names()
+            if t not in ["batch_crate", "property_stats", "property"]
+        ]
+        outputs.append(
+            (
+                {
+                    (t, crate_id): rows(tb.db, t, crate_id)
+                    for t in tables
+                    for crate_id, _ in batch
+                },
+                set(tb.cf["tables"]["Dataset"].get("junctions", [])),
+            )
+        )
+        tb.close()
+    assert all(output == outputs[0] for output in outputs)
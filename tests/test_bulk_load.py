@@ -0,0 +1,69 @@
+from pathlib import Path
+from rocrate_tabular.tabulator import ROCrateTabulator, BULK_LOAD_PRAGMAS, PROPERTIES
+from sqlite_utils import Database
+from tinycrate.tinycrate import minimal_crate
+
+
+def pragmas(db):
+    return {p: db.execute(f"PRAGMA {p}").fetchone()[0] for p in BULK_LOAD_PRAGMAS}
+
+
+def test_batches(crates, tmp_path):
+    """Small batches should give the same table as one big one"""
+    tb = ROCrateTabulator()
+    tb.crate_to_db(crates["languageFamily"], Path(tmp_path) / "one.db")
+    tbb = ROCrateTabulator()
+    tbb.batch_size = 7
+    tbb.crate_to_db(crates["languageFamily"], Path(tmp_path) / "batched.db")
+    query = "SELECT * FROM property ORDER BY row_id"
+    assert list(tbb.db.query(query)) == list(tb.db.query(query))
+    assert tbb.load_stats["rows"] == tb.db["property"].count
+    assert tbb.load_stats["rows_per_sec"] > 0
+
+
+def test_pragmas_restored(crates, tmp_path):
+    dbfile = Path(tmp_path) / "sqlite.db"
+    defaults = pragmas(Database(Path(tmp_path) / "other.db"))
+    tb = ROCrateTabulator()
+    tb.crate_to_db(crates["wide"], dbfile)
+    assert pragmas(tb.db) == defaults
+    assert not tb.db.conn.in_transaction
+
+
+def test_relation_names(tmp_path):
+    """Relation rows get their target's name from the id index"""
+    crate = minimal_crate(name="Relations")
+    crate.add("Person", "#named", {"name": "Named"})
+    crate.add("Person", "#unnamed", {})
+    crate.add(
+        "Thing",
+        "#thing",
+        {"author": [{"@id": "#named"}, {"@id": "#unnamed"}, {"@id": "#missing"}]},
+    )
+    crate.write_json(Path(tmp_path))
+    tb = ROCrateTabulator()
+    tb.crate_to_db(str(tmp_path), Path(tmp_path) / "sqlite.db")
+    assert tb.entity_names["#named"] == "Named"
+    rows = tb.db.query(
+        "SELECT target_id, value FROM property WHERE source_id = '#thing' "
+        "AND property_label = 'author' ORDER BY row_id"
+    )
+    assert [(r["target_id"], r["value"]) for r in rows] == [
+        ("#named", "Named"),
+        ("#unnamed", None),
+        ("#missing", ""),
+    ]
+
+
+def test_row_tuples(crates, tmp_path):
+    """Rows are tuples in the order of the property table's columns"""
+    tb = ROCrateTabulator()
+    tb.crate_to_db(crates["minimal"], Path(tmp_path) / "sqlite.db")
+    root = tb.crate.root()
+    rows = list(tb.entity_properties(root))
+    assert all(len(row) == len(PROPERTIES) for row in rows)
+    assert [row[0] for row in rows] == list(range(len(rows)))
+    stored = tb.db.execute(
+        "SELECT * FROM property WHERE source_id = ? ORDER BY row_id", [root["@id"]]
+    ).fetchall()
+    assert [row[1:] for row in rows] == [row[1:] for row in stored]
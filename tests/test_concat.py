@@ -0,0 +1,62 @@
+from pathlib import Path
+from rocrate_tabular.tabulator import ROCrateTabulator, CSV_TABLE
+from tinycrate.tinycrate import minimal_crate
+import pytest
+
+
+def csv_crate(crate_dir):
+    """A crate with CSV files with different columns, one of which is
+    missing"""
+    crate_dir = Path(crate_dir)
+    (crate_dir / "data").mkdir(parents=True)
+    (crate_dir / "data" / "a.csv").write_text(
+        'id,name,notes\n1,one,"two\nlines"\n2,two,\n3,three,x\n', encoding="utf-8"
+    )
+    (crate_dir / "data" / "b c.csv").write_text(
+        "name,colour,source_file\nfour,blue,x.csv\n", encoding="utf-8"
+    )
+    crate = minimal_crate(name="CSV files")
+    for file_id in ["data/a.csv", "data/b%20c.csv", "data/missing.csv"]:
+        crate.add("File", file_id, {"name": file_id})
+    crate.write_json(crate_dir)
+
+
+def csv_rows(tb):
+    return list(tb.db.query(f"SELECT * FROM {CSV_TABLE} ORDER BY 1, 2"))
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_concat(tmp_path, jobs):
+    crate_dir = Path(tmp_path) / "crate"
+    csv_crate(crate_dir)
+    tb = ROCrateTabulator()
+    tb.batch_size = 2
+    tb.crate_to_db(str(crate_dir), Path(tmp_path) / "sqlite.db")
+    results = tb.find_csv_contents(jobs=jobs)
+    assert results["data/a.csv"] == {"rows": 3, "error": None}
+    assert results["data/b%20c.csv"] == {"rows": 1, "error": None}
+    assert results["data/missing.csv"]["rows"] == 0
+    assert results["data/missing.csv"]["error"]
+    assert tb.db[CSV_TABLE].columns_dict == {
+        "source_file": str,
+        "source_row": int,
+        "id": str,
+        "name": str,
+        "notes": str,
+        "colour": str,
+    }
+    rows = csv_rows(tb)
+    assert [(r["source_file"], r["source_row"], r["name"]) for r in rows] == [
+        ("data/a.csv", 1, "one"),
+        ("data/a.csv", 2, "two"),
+        ("data/a.csv", 3, "three"),
+        ("data/b%20c.csv", 1, "four"),
+    ]
+    assert rows[0]["notes"] == "two\nlines"
+    assert rows[3]["colour"] == "blue" and rows[3]["id"] is None
+
+    # loading the files again replaces their rows
+    (crate_dir / "data" / "a.csv").write_text("id,name\n9,nine\n", encoding="utf-8")
+    tb.find_csv_contents(jobs=jobs)
+    assert [r["name"] for r in csv_rows(tb)] == ["nine", "four"]
+    tb.close()
@@ -0,0 +1,155 @@
+from pathlib import Path
+from rocrate_tabular.tabulator import EntityRecord, can_pivot
+from tinycrate.tinycrate import minimal_crate
+from util import tabulate
+import json
+import pytest
+
+
+def per_entity_rows(tb, table):
+    """Build a table's rows the slow way, with one query per entity"""
+    rows = {}
+    for entity_id in tb.fetch_ids(table):
+        entity = EntityRecord(tabulator=tb, table=table, entity_id=entity_id)
+        entity.build(tb.fetch_properties(entity_id))
+        rows[entity_id] = {k: v for k, v in entity.data.items() if v is not None}
+    return rows
+
+
+def table_rows(tb, table):
+    rows = {}
+    for row in tb.db[table].rows:
+        rows[row["entity_id"]] = {k: v for k, v in row.items() if v is not None}
+    return rows
+
+
+@pytest.mark.parametrize("crate", ["wide", "languageFamily"])
+def test_grouped_scan(crates, tmp_path, crate):
+    """entity_table should give the same rows as building each entity from
+    its own fetch_properties query"""
+    tb = tabulate(crates[crate], Path(tmp_path) / "sqlite.db")
+    for table in tb.cf["tables"]:
+        tb.entity_table(table)
+        assert table_rows(tb, table) == per_entity_rows(tb, table)
+
+
+def test_expansion_cache(crates, tmp_path):
+    """Expanded targets should only be queried once across tables"""
+    dbfile = Path(tmp_path) / "sqlite.db"
+    tb = tabulate(crates["languageFamily"], dbfile)
+    tb.cf["tables"]["RepositoryObject"]["expand_props"] = ["license"]
+    tb.cf["tables"]["RepositoryCollection"]["expand_props"] = ["license"]
+    tb.entity_table("RepositoryObject")
+    info = tb.fetch_expanded.cache_info()
+    n_objects = tb.db["RepositoryObject"].count
+    assert info.hits + info.misses == n_objects
+    licenses = {
+        tb.crate.get(eid)["license"]["@id"] for eid in tb.fetch_ids("RepositoryObject")
+    }
+    assert info.misses == len(licenses)
+    tb.entity_table("RepositoryCollection")
+    assert tb.fetch_expanded.cache_info().hits > info.hits
+    names = {row["license_name"] for row in tb.db["RepositoryObject"].rows}
+    assert names == {tb.crate.get(lid)["name"] for lid in licenses}
+    tb.crate_to_db(crates["languageFamily"], dbfile)
+    assert tb.fetch_expanded.cache_info().currsize == 0
+
+
+@pytest.mark.parametrize("crate", ["wide", "languageFamily"])
+def test_precomputed_columns(crates, tmp_path, crate):
+    """The planned columns should be exactly the ones the entities have, and
+    the table should be built without altering it"""
+    tb = tabulate(crates[crate], Path(tmp_path) / "sqlite.db")
+    for table in tb.cf["tables"]:
+        tb.cf["tables"][table]["expand_props"] = ["license", "inLanguage"]
+        tb.cf["tables"][table]["ignore_props"] = ["description"]
+    statements = []
+    tb.db.conn.set_trace_callback(statements.append)
+    for table in tb.cf["tables"]:
+        tb.entity_table(table)
+        keys = set()
+        for entity_id in tb.fetch_ids(table):
+            entity = EntityRecord(tabulator=tb, table=table, entity_id=entity_id)
+            entity.build(tb.fetch_properties(entity_id))
+            keys.update(entity.data)
+        assert set(tb.db[table].columns_dict) == keys
+    assert not [s for s in statements if s.upper().startswith("ALTER")]
+
+
+def test_parallel_tables(crates, tmp_path):
+    """Building tables in worker processes should give the same database as
+    building them one after another"""
+    tb = tabulate(crates["wide"], Path(tmp_path) / "sequential.db")
+    tbp = tabulate(crates["wide"], Path(tmp_path) / "parallel.db")
+    tables = list(tb.cf["tables"])
+    sequential = dict(tb.entity_tables(tables))
+    parallel = dict(tbp.entity_tables(tables, jobs=2))
+    assert parallel == sequential
+    assert tbp.cf == tb.cf
+    assert tbp.db.table_names() == tb.db.table_names()
+    for table in tb.db.table_names():
+        assert tbp.db[table].schema == tb.db[table].schema
+        query = f"SELECT * FROM [{table}] ORDER BY rowid"
+        assert list(tbp.db.query(query)) == list(tb.db.query(query))
+
+
+def all_rows(tb):
+    """Every row of every table apart from the property table"""
+    return {
+        name: sorted(json.dumps(row, sort_keys=True) for row in tb.db[name].rows)
+        for name in tb.db.table_names()
+        if name not in ("property", "entity_hash", "crate_context")
+    }
+
+
+def build_with_engine(crate, db_file, engine, configure=None, text_prop=None):
+    tb = tabulate(crate, db_file)
+    tb.engine = engine
+    tb.text_prop = text_prop
+    if configure is not None:
+        configure(tb.cf["tables"])
+    allprops = {table: tb.entity_table(table) for table in tb.cf["tables"]}
+    return tb, allprops
+
+
+def expand_license(tables):
+    for table in ["RepositoryObject", "RepositoryCollection"]:
+        tables[table]["expand_props"] = ["license", "inLanguage"]
+        tables[table]["ignore_props"] = ["description", "license_@type"]
+
+
+@pytest.mark.parametrize(
+    "crate, configure, text_prop",
+    [
+        ("wide", None, None),
+        ("languageFamily", None, None),
+        ("languageFamily", expand_license, None),
+        ("textfiles", None, "indexableText"),
+    ],
+)
+def test_sql_engine(crates, tmp_path, crate, configure, text_prop):
+    """The SQL pivot engine should build the same tables as EntityRecord"""
+    tb, allprops = build_with_engine(
+        crates[crate], Path(tmp_path) / "python.db", "python", configure, text_prop
+    )
+    tbs, allprops_sql = build_with_engine(
+        crates[crate], Path(tmp_path) / "sql.db", "sql", configure, text_prop
+    )
+    assert all_rows(tbs) == all_rows(tb)
+    assert allprops_sql == allprops
+    for table in tb.cf["tables"]:
+        assert tbs.db[table].columns_dict == tb.db[table].columns_dict
+
+
+def test_sql_engine_fallback(tmp_path):
+    """Columns which EntityRecord numbers on the fly are left to it"""
+    crate = minimal_crate(name="Clash")
+    crate.add("Person", "#a", {"name": "A"})
+    crate.add("Thing", "#t", {"author": {"@id": "#a"}, "author_id": "literal"})
+    crate.write_json(Path(tmp_path))
+    tb = tabulate(str(tmp_path), Path(tmp_path) / "sqlite.db")
+    tb.engine = "sql"
+    specs = tb.column_specs("Thing")
+    assert not can_pivot(specs)
+    tb.entity_table("Thing")
+    assert tb.db["Thing"].get("#t")["author_id_1"] in ("#a", "literal")
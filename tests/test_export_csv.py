@@ -1,9 +1,13 @@
 from pathlib import Path
-from rocrate_tabular.tabulator import ROCrateTabulator
+from rocrate_tabular.tabulator import ROCrateTabulator, ROCrateTabulatorException
 from tinycrate.tinycrate import TinyCrate
+import gzip
 import json
+import lzma
+import pytest
 import sys
 import csv
+from util import tabulate
 
 
 def read_config(cffile):
@@ -73,3 +77,127 @@ def test_export(crates, csv_headers, tmp_path):
 
     for ro in objects:
         assert ro["@id"] in csv_data
+
+
+def offline_tabulator(crate, dbfile):
+    """A tabulator whose crate context doesn't need to be fetched"""
+    tb = tabulate(crate, dbfile, tables=[])
+    tb.crate.context = {"@vocab": "http://schema.org/"}
+    return tb
+
+
+def test_export_stream(crates, tmp_path):
+    cwd = Path(tmp_path)
+    tb = offline_tabulator(crates["languageFamily"], cwd / "lf.db")
+    tb.batch_size = 10
+    tb.cf["export_queries"] = {
+        "props.csv": "SELECT * FROM property ORDER BY row_id",
+        "nothing.csv": "SELECT source_id, value FROM property WHERE 0",
+    }
+    tb.db["property"].insert({"row_id": 999999, "value": "two\nlines"})
+    tb.export_csv(cwd / "csv")
+
+    props = list(tb.db.query("SELECT * FROM property ORDER BY row_id"))
+    with open(cwd / "csv" / "props.csv", "r", newline="") as cfh:
+        rows = list(csv.DictReader(cfh))
+    assert len(rows) == len(props) == tb.export_stats["props.csv"]["rows"]
+    assert rows[-1]["value"] == "two\\nlines"
+    assert [row["source_id"] for row in rows] == [p["source_id"] or "" for p in props]
+
+    with open(cwd / "csv" / "nothing.csv", "r", newline="") as cfh:
+        assert list(csv.reader(cfh)) == [["source_id", "value"]]
+    assert tb.export_stats["nothing.csv"]["rows"] == 0
+    schema = TinyCrate(cwd / "csv").get("#SCHEMA_nothing.csv")
+    assert len(schema["columns"]) == 2
+
+
+def test_export_parallel(crates, tmp_path):
+    """Running the exports in parallel gives the same files"""
+    cwd = Path(tmp_path)
+    outputs = {}
+    for jobs in [1, 3]:
+        tb = offline_tabulator(crates["languageFamily"], cwd / f"{jobs}.db")
+        tb.cf["export_queries"] = {
+            f"{label}.csv": f"SELECT * FROM property WHERE property_label = '{label}'"
+            for label in ["name", "@type", "hasPart", "description"]
+        }
+        tb.export_csv(cwd / f"csv{jobs}", jobs=jobs)
+        outputs[jobs] = {
+            f.name: f.read_text() for f in sorted((cwd / f"csv{jobs}").iterdir())
+        }
+        tb.close()
+    assert len(outputs[3]) == 5
+    assert outputs[3] == outputs[1]
+
+
+def test_export_formats(crates, tmp_path):
+    """Compressed and JSON Lines exports, by extension or by config"""
+    cwd = Path(tmp_path)
+    tb = offline_tabulator(crates["languageFamily"], cwd / "lf.db")
+    query = "SELECT source_id, property_label, value FROM property ORDER BY row_id"
+    tb.cf["export_queries"] = {
+        "props.csv": query,
+        "props.csv.gz": query,
+        "props.jsonl.xz": query,
+        "props.txt": {"query": query, "format": "jsonl", "compression": "gzip"},
+    }
+    tb.export_csv(cwd / "csv")
+
+    with open(cwd / "csv" / "props.csv", newline="") as cfh:
+        rows = list(csv.DictReader(cfh))
+    with gzip.open(cwd / "csv" / "props.csv.gz", "rt", newline="") as cfh:
+        assert list(csv.DictReader(cfh)) == rows
+    with lzma.open(cwd / "csv" / "props.jsonl.xz", "rt") as jfh:
+        assert [json.loads(line) for line in jfh] == list(tb.db.query(query))
+    with gzip.open(cwd / "csv" / "props.txt", "rt") as jfh:
+        assert len(jfh.readlines()) == len(rows)
+    assert tb.export_stats["props.txt"]["format"] == "jsonl"
+
+    schema_crate = TinyCrate(cwd / "csv")
+    assert schema_crate.get("props.csv")["encodingFormat"] == "text/csv"
+    assert schema_crate.get("props.jsonl.xz")["encodingFormat"] == [
+        "application/x-xz",
+        "application/jsonl",
+    ]
+    assert len(schema_crate.get("#SCHEMA_props.txt")["columns"]) == 3
+
+
+def test_export_jsonl_values(crates, tmp_path):
+    """Blobs are base64 encoded, and duplicate column names are an error"""
+    tb = offline_tabulator(crates["minimal"], Path(tmp_path) / "min.db")
+    jsonl = Path(tmp_path) / "blob.jsonl"
+    tb.write_jsonl("SELECT X'00ff' AS blob, 'a' AS text", jsonl)
+    assert json.loads(jsonl.read_text()) == {"blob": "AP8=", "text": "a"}
+    with pytest.raises(ROCrateTabulatorException, match="a, b"):
+        tb.write_jsonl("SELECT 1 AS b, 2 AS a, 3 AS b, 4 AS a", jsonl)
+
+
+def test_export_bad_format(crates, tmp_path):
+    tb = offline_tabulator(crates["minimal"], Path(tmp_path) / "min.db")
+    tb.cf["export_queries"] = {"x.csv": {"query": "SELECT 1", "compression": "zip"}}
+    with pytest.raises(ROCrateTabulatorException):
+        tb.export_csv(Path(tmp_path) / "csv")
+
+
+def test_export_terms(crates, tmp_path, monkeypatch):
+    """Each base term is resolved once across all of the exported files"""
+    cwd = Path(tmp_path)
+    tb = offline_tabulator(crates["languageFamily"], cwd / "lf.db")
+    tb.crate.add("rdf:Property", "http://schema.org/name", {"rdfs:comment": "A name"})
+    resolved = []
+    resolve_term = tb.crate.resolve_term
+
+    def counting_resolve_term(term):
+        resolved.append(term)
+        return resolve_term(term)
+
+    monkeypatch.setattr(tb.crate, "resolve_term", counting_resolve_term)
+    query = "SELECT value AS name, value AS name_1, value AS author_name FROM property"
+    tb.cf["export_queries"] = {"a.csv": query, "b.csv": query}
+    tb.export_csv(cwd / "csv")
+    assert resolved == ["name", "1"]
+    schema_crate = TinyCrate(cwd / "csv")
+    column = schema_crate.get("#COLUMN_b.csv_author_name")
+    assert column["propertyUrl"] == "http://schema.org/name"
+    assert column["description"] == "A name"
+    assert column["label"] == "name"
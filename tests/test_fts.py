@@ -0,0 +1,75 @@
+from pathlib import Path
+from tinycrate.tinycrate import TinyCrate, minimal_crate
+import pytest
+from util import tabulate
+
+
+def matches(tb, table, query):
+    return sorted(row["entity_id"] for row in tb.fetch_matches(table, query))
+
+
+def check_index(tb, table):
+    """FTS5's integrity check raises an error if the index and the table
+    don't agree"""
+    fts = f"{table}_fts"
+    with tb.db.conn:
+        tb.db.conn.execute(
+            f"INSERT INTO [{fts}] ([{fts}], rank) VALUES ('integrity-check', 1)"
+        )
+
+
+def people_crate(crate_dir):
+    crate = minimal_crate(name="People")
+    for i, name in enumerate(["Ada Lovelace", "Alan Turing", "Grace Hopper"]):
+        crate.add("Person", f"#p{i}", {"name": name, "description": f"Person {i}"})
+    crate.write_json(Path(crate_dir))
+
+
+def build(crate_dir, db_file, fts_columns, jobs=1, **kwargs):
+    tb = tabulate(crate_dir, db_file, ["Person"], **kwargs)
+    tb.cf["tables"]["Person"]["fts_columns"] = fts_columns
+    list(tb.entity_tables(["Person"], jobs=jobs))
+    return tb
+
+
+def test_fts_text(crates, tmp_path):
+    tb = tabulate(crates["textfiles"], Path(tmp_path) / "sqlite.db", ["Dataset"])
+    tb.cf["tables"]["Dataset"]["fts_columns"] = ["indexableText", "name", "missing"]
+    tb.text_prop = "indexableText"
+    tb.entity_table("Dataset")
+    assert list(tb.db["Dataset_fts"].columns_dict) == ["indexableText", "name"]
+    assert matches(tb, "Dataset", "consectetur") == ["doc001"]
+    assert matches(tb, "Dataset", "name:minimal") == ["./"]
+    assert matches(tb, "Dataset", "nowhere") == []
+    check_index(tb, "Dataset")
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_fts_incremental(tmp_path, jobs):
+    crate_dir = Path(tmp_path) / "crate"
+    people_crate(crate_dir)
+    db_file = Path(tmp_path) / "sqlite.db"
+    tb = build(crate_dir, db_file, ["name", "description"], jobs)
+    assert matches(tb, "Person", "turing") == ["#p1"]
+    tb.close()
+
+    crate = TinyCrate(crate_dir)
+    crate.get("#p1")["name"] = "Alonzo Church"
+    crate.graph = [e for e in crate.graph if e["@id"] != "#p2"]
+    crate.write_json(crate_dir)
+    tbi = build(crate_dir, db_file, ["name", "description"], jobs, incremental=True)
+    assert tbi.incremental
+    assert matches(tbi, "Person", "turing") == []
+    assert matches(tbi, "Person", "church") == ["#p1"]
+    assert matches(tbi, "Person", "hopper") == []
+    assert matches(tbi, "Person", "person") == ["#p0", "#p1"]
+    check_index(tbi, "Person")
+    tbi.close()
+
+    # changing the columns rebuilds the index, and removing them drops it
+    tbc = build(crate_dir, db_file, ["name"], jobs, incremental=True)
+    assert matches(tbc, "Person", "person") == []
+    check_index(tbc, "Person")
+    tbc.cf["tables"]["Person"]["fts_columns"] = []
+    tbc.entity_table("Person")
+    assert not tbc.db["Person_fts"].exists()
@@ -0,0 +1,79 @@
+from pathlib import Path
+from rocrate_tabular.tabulator import (
+    ROCrateTabulator,
+    ROCrateTabulatorException,
+    HTTPCache,
+)
+from werkzeug import Response
+import pytest
+from util import tabulate
+
+ETAG = '"crate-v1"'
+
+
+@pytest.fixture
+def crate_url(crates, httpserver):
+    """Serve the textfiles crate, answering conditional requests"""
+    crate_dir = Path(crates["textfiles"])
+    with open(crate_dir / "ro-crate-metadata.json", "rb") as fh:
+        jsonld = fh.read()
+
+    def metadata(request):
+        if request.headers.get("If-None-Match") == ETAG:
+            return Response(status=304)
+        return Response(jsonld, headers={"ETag": ETAG})
+
+    httpserver.expect_request("/ro-crate-metadata.json").respond_with_handler(metadata)
+    with open(crate_dir / "doc001/textfile.txt", "rb") as fh:
+        httpserver.expect_request("/doc001/textfile.txt").respond_with_data(fh.read())
+    return httpserver.url_for("/ro-crate-metadata.json")
+
+
+def test_http_cache(crates, crate_url, tmp_path):
+    cache = HTTPCache(Path(tmp_path) / "cache")
+    for stream in [False, True]:
+        tb = ROCrateTabulator()
+        tb.http_cache = cache
+        tb.crate_to_db(crate_url, Path(tmp_path) / "sqlite.db", stream=stream)
+        assert tb.db["property"].count > 0
+        tb.close()
+    assert cache.stats == {"downloaded": 1, "not_modified": 1}
+
+
+def test_http_text(crates, crate_url, tmp_path):
+    """Relative text targets of a remote crate are fetched from the server"""
+    tb = tabulate(crate_url, Path(tmp_path) / "sqlite.db", ["Dataset"])
+    tb.text_prop = "indexableText"
+    tb.entity_table("Dataset")
+    text_file = Path(crates["textfiles"]) / "doc001/textfile.txt"
+    with open(text_file, encoding="utf-8") as fh:
+        assert tb.db["Dataset"].get("doc001")["indexableText"] == fh.read()
+
+
+def test_http_text_max_bytes(crate_url):
+    """A remote text whose Content-Length is over text_max_bytes is
+    rejected without reading it"""
+    tb = ROCrateTabulator()
+    tb.crate_dir = crate_url
+    tb.text_max_bytes = 10
+    with pytest.raises(ROCrateTabulatorException, match="larger than 10 bytes"):
+        tb.fetch_text("doc001/textfile.txt")
+    tb.text_max_bytes = None
+    assert tb.fetch_text("doc001/textfile.txt").startswith("Lorem")
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_http_cache_batch(crate_url, tmp_path, jobs):
+    """Batch workers fetch crates through the tabulator's cache, and their
+    downloads and revalidations are counted"""
+    cache_dir = Path(tmp_path) / "cache"
+    for i, stats in enumerate(
+        [{"downloaded": 1, "not_modified": 0}, {"downloaded": 0, "not_modified": 1}]
+    ):
+        tb = ROCrateTabulator()
+        tb.http_cache = HTTPCache(cache_dir)
+        tb.crates_to_db([("remote", crate_url)], Path(tmp_path) / f"{i}.db", jobs=jobs)
+        assert tb.db["property"].count > 0
+        tb.record_caches()
+        assert tb.instrumentation.caches["http"] == stats
+        tb.close()
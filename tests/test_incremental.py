@@ -0,0 +1,132 @@
+from pathlib import Path
+from rocrate_tabular.tabulator import ROCrateTabulator
+from tinycrate.tinycrate import TinyCrate, minimal_crate
+import pytest
+import shutil
+from util import tabulate
+
+
+def build(crate_dir, db_file, cf=None, **kwargs):
+    tb = tabulate(crate_dir, db_file, **kwargs)
+    if cf is not None:
+        tb.cf = cf
+    for table, allprops in tb.entity_tables(list(tb.cf["tables"])):
+        tb.cf["tables"][table]["all_props"] = sorted(allprops)
+    return tb
+
+
+def properties(tb):
+    rows = tb.db.query(
+        "SELECT source_id, source_name, property_label, target_id, value FROM property"
+    )
+    return sorted(tuple(str(v) for v in row.values()) for row in rows)
+
+
+def table_rows(tb, table):
+    rows = [
+        {k: v for k, v in row.items() if v is not None} for row in tb.db[table].rows
+    ]
+    return sorted(rows, key=lambda row: sorted(row.items()))
+
+
+def edit_crate(crate_dir):
+    """Rename an entity which other entities refer to, remove one and add
+    one"""
+    crate = TinyCrate(crate_dir)
+    crate.get("#Omniglot")["name"] = "Omniglot (renamed)"
+    crate.graph = [e for e in crate.graph if e["@id"] != "#UDHR_Welsh"]
+    crate.add("Person", "#newperson", {"name": "New Person"})
+    crate.write_json(crate_dir)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_incremental(crates, tmp_path, stream):
+    crate_dir = Path(tmp_path) / "crate"
+    crate_dir.mkdir()
+    shutil.copy(Path(crates["languageFamily"]) / "ro-crate-metadata.json", crate_dir)
+    inc_db = Path(tmp_path) / "incremental.db"
+    tb = build(crate_dir, inc_db, stream=stream)
+    cf = tb.cf
+    tb.close()
+
+    edit_crate(crate_dir)
+    tbi = build(crate_dir, inc_db, cf, stream=stream, incremental=True)
+    assert tbi.incremental
+    dirty = {row["entity_id"] for row in tbi.db["dirty_entity"].rows}
+    assert {"#Omniglot", "#UDHR_Welsh", "#newperson"} <= dirty
+    assert len(dirty) < tbi.db["entity_hash"].count
+
+    tbf = build(crate_dir, Path(tmp_path) / "full.db", stream=stream)
+    assert properties(tbi) == properties(tbf)
+    # the positions are rowids, which differ after an update
+    stats = "SELECT * FROM property_stats ORDER BY entity_type, property_label"
+    for i, f in zip(tbi.db.query(stats), tbf.db.query(stats), strict=True):
+        assert i | {"position": None} == f | {"position": None}
+    for table in tbf.cf["tables"]:
+        assert table_rows(tbi, table) == table_rows(tbf, table)
+
+
+def test_incremental_needs_hashes(crates, tmp_path):
+    """An incremental build on a new database is a full build"""
+    tb = ROCrateTabulator()
+    tb.crate_to_db(crates["minimal"], Path(tmp_path) / "sqlite.db", incremental=True)
+    assert not tb.incremental
+    assert tb.db["entity_hash"].count == len(TinyCrate(crates["minimal"]).graph)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_incremental_multi_valued_name(tmp_path, stream):
+    """Renaming an entity to a list of names updates relations to it with
+    the names serialised as a full build would"""
+    crate_dir = Path(tmp_path) / "crate"
+    crate = minimal_crate(name="Names", date_published="2025-01-01")
+    crate.add("Person", "#a", {"name": "Alice"})
+    crate.add("Thing", "#t", {"name": "Thing", "author": {"@id": "#a"}})
+    crate.write_json(crate_dir)
+    db_file = Path(tmp_path) / "sqlite.db"
+    build(crate_dir, db_file, stream=stream).close()
+
+    crate = TinyCrate(crate_dir)
+    crate.get("#a")["name"] = ["Alice", "Zed"]
+    crate.write_json(crate_dir)
+    tbi = build(crate_dir, db_file, stream=stream, incremental=True)
+    assert tbi.incremental
+    (value,) = tbi.db.execute(
+        "SELECT value FROM property WHERE source_id = '#t' AND target_id = '#a'"
+    ).fetchone()
+    assert value == '["Alice", "Zed"]'
+    tbf = build(crate_dir, Path(tmp_path) / "full.db", stream=stream)
+    assert properties(tbi) == properties(tbf)
+
+
+def test_incremental_streams(tmp_path):
+    """Each changed entity is written before the next one is read"""
+    crate_dir = Path(tmp_path) / "crate"
+    crate = minimal_crate(name="Stream", date_published="2025-01-01")
+    for i in range(5):
+        crate.add("Person", f"#p{i}", {"name": f"Person {i}"})
+    crate.write_json(crate_dir)
+    tb = build(crate_dir, Path(tmp_path) / "sqlite.db")
+
+    def edited():
+        written = []
+        for e in TinyCrate(crate_dir).all():
+            for eid in written:
+                assert tb.db.execute(
+                    "SELECT 1 FROM property WHERE source_id = ? AND value = ?",
+                    [eid, f"Renamed {eid}"],
+                ).fetchone()
+            if e["@id"].startswith("#p"):
+                e["name"] = f"Renamed {e['@id']}"
+                written.append(e["@id"])
+            yield e
+
+    tb.batch_size = 1
+    tb.update_properties(edited())
+    dirty = {row["entity_id"] for row in tb.db["dirty_entity"].rows}
+    assert dirty == {f"#p{i}" for i in range(5)}
+    names = tb.db.execute(
+        "SELECT source_id, value FROM property WHERE property_label = 'name' "
+        "AND source_id LIKE '#p%'"
+    ).fetchall()
+    assert sorted(names) == [(f"#p{i}", f"Renamed #p{i}") for i in range(5)]
@@ -0,0 +1,42 @@
+from pathlib import Path
+from rocrate_tabular.tabulator import ROCrateTabulator, PROPERTY_INDEXES
+import pytest
+
+
+@pytest.fixture
+def tabulator(crates, tmp_path):
+    tb = ROCrateTabulator()
+    tb.crate_to_db(crates["languageFamily"], Path(tmp_path) / "sqlite.db")
+    yield tb
+    tb.close()
+
+
+def test_indexes_created(tabulator):
+    indexes = {index.name for index in tabulator.db["property"].indexes}
+    assert indexes == set(PROPERTY_INDEXES)
+
+
+def test_no_indexes(crates, tmp_path):
+    tb = ROCrateTabulator()
+    tb.crate_to_db(crates["minimal"], Path(tmp_path) / "sqlite.db", indexes=False)
+    assert tb.db["property"].indexes == []
+
+
+def test_query_plans(tabulator):
+    """None of the helper queries should fall back to scanning the table"""
+    statements = []
+    tabulator.db.conn.set_trace_callback(statements.append)
+    list(tabulator.fetch_types())
+    list(tabulator.fetch_ids("RepositoryObject"))
+    list(tabulator.fetch_properties("#Omniglot"))
+    list(tabulator.fetch_relation_counts("RepositoryObject"))
+    list(tabulator.fetch_property_stats("RepositoryObject"))
+    list(tabulator.fetch_entities("RepositoryObject"))
+    tabulator.find_csv()
+    tabulator.db.conn.set_trace_callback(None)
+    selects = [s for s in statements if s.strip().upper().startswith("SELECT")]
+    assert len(selects) == 7
+    for sql in selects:
+        plan = tabulator.db.conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+        for _, _, _, detail in plan:
+            assert not detail.startswith("SCAN"), f"{detail} in {sql}"
@@ -0,0 +1,79 @@
+from pathlib import Path
+from rocrate_tabular.tabulator import ROCrateTabulator, Instrumentation
+import json
+import pytest
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_metrics(crates, tmp_path, jobs):
+    cwd = Path(tmp_path)
+    instrumentation = Instrumentation(progress=False, trace_sql=True)
+    tb = ROCrateTabulator(instrumentation=instrumentation)
+    tb.crate_to_db(crates["languageFamily"], cwd / "lf.db")
+    tb.crate.context = {"@vocab": "http://schema.org/"}
+    tb.infer_config()
+    tb.cf["tables"] = tb.cf["potential_tables"]
+    tables = list(tb.cf["tables"])
+    for table, allprops in tb.entity_tables(tables, jobs=jobs):
+        tb.cf["tables"][table]["all_props"] = list(allprops)
+    tb.cf["export_queries"] = {"props.csv": "SELECT * FROM property"}
+    tb.export_csv(cwd / "csv")
+    tb.write_metrics(cwd / "metrics.json")
+
+    with open(cwd / "metrics.json") as fh:
+        metrics = json.load(fh)
+    phases = {}
+    for record in metrics["phases"]:
+        phases.setdefault(record["name"], []).append(record)
+    assert phases["write_properties"][0]["rows"] == tb.load_stats["rows"]
+    assert sorted(r["table"] for r in phases["entity_table"]) == sorted(tables)
+    assert sum(r["rows"] for r in phases["entity_table"]) == sum(
+        tb.db[table].count for table in tables
+    )
+    assert phases["export"][0]["rows"] == tb.db["property"].count
+    assert all(r["seconds"] >= 0 for r in metrics["phases"])
+    assert metrics["sql"]["INSERT"]["rows"] >= tb.load_stats["rows"]
+    assert metrics["sql"]["SELECT"]["count"] > 0
+    assert "expansion" in metrics["caches"]
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_expansion_cache_workers(crates, tmp_path, jobs):
+    """Worker processes use the tabulator's expansion cache size, and their
+    hits and misses are added to its own"""
+    instrumentation = Instrumentation(progress=False)
+    tb = ROCrateTabulator(expansion_cache_size=0, instrumentation=instrumentation)
+    tb.crate_to_db(crates["languageFamily"], Path(tmp_path) / "lf.db")
+    tb.infer_config()
+    tables = ["RepositoryObject", "RepositoryCollection"]
+    for table in tables:
+        tb.cf["tables"][table] = tb.cf["potential_tables"][table]
+        tb.cf["tables"][table]["expand_props"] = ["license"]
+    list(tb.entity_tables(tables, jobs=jobs))
+    tb.record_caches()
+    cache = instrumentation.caches["expansion"]
+    assert cache["hits"] == 0
+    assert cache["misses"] > 0
+    assert cache["maxsize"] == 0
+
+
+def test_instrumentation_hooks(crates, tmp_path):
+    """Subclasses see phases as they start and end"""
+
+    class Recorder(Instrumentation):
+        def __init__(self):
+            super().__init__(progress=False)
+            self.events = []
+
+        def phase_started(self, record):
+            self.events.append(("start", record["name"]))
+
+        def phase_ended(self, record):
+            self.events.append(("end", record["name"]))
+
+    tb = ROCrateTabulator(instrumentation=Recorder())
+    tb.crate_to_db(crates["minimal"], Path(tmp_path) / "sqlite.db")
+    events = tb.instrumentation.events
+    assert events[0] == ("start", "load_crate")
+    assert ("end", "write_properties") in events
+    assert tb.instrumentation.sql == {}
@@ -0,0 +1,83 @@
+from collections import defaultdict
+from pathlib import Path
+from rocrate_tabular.tabulator import MAX_NUMBERED_COLS, ROCrateTabulator
+from tinycrate.tinycrate import minimal_crate
+import pytest
+from util import tabulate
+
+
+def expected_stats(tb):
+    """Work out property_stats from the property table in Python"""
+    types = defaultdict(set)
+    cells = defaultdict(list)
+    for row in tb.db.query("SELECT * FROM property ORDER BY rowid"):
+        if row["property_label"] == "@type":
+            types[row["source_id"]].add(row["value"])
+        cells[row["source_id"], row["property_label"]].append(row["target_id"])
+    stats = {}
+    for (source_id, label), targets in cells.items():
+        for attype in types[source_id]:
+            s = stats.setdefault(
+                (attype, label),
+                {"entities": 0, "max_values": 0, "max_targets": 0, "targets": set()},
+            )
+            relations = [t for t in targets if t is not None]
+            s["entities"] += 1
+            s["max_values"] = max(s["max_values"], len(targets))
+            s["max_targets"] = max(s["max_targets"], len(relations))
+            s["targets"].update(relations)
+    return {
+        key: (s["entities"], s["max_values"], s["max_targets"], len(s["targets"]))
+        for key, s in stats.items()
+    }
+
+
+@pytest.mark.parametrize("crate", ["minimal", "wide", "languageFamily"])
+def test_property_stats(crates, tmp_path, crate):
+    tb = ROCrateTabulator()
+    tb.crate_to_db(crates[crate], Path(tmp_path) / "sqlite.db")
+    stats = {
+        (r["entity_type"], r["property_label"]): (
+            r["entities"],
+            r["max_values"],
+            r["max_targets"],
+            r["distinct_targets"],
+        )
+        for r in tb.fetch_property_stats()
+    }
+    assert stats == expected_stats(tb)
+    tb.infer_config()
+    for attype, cf in tb.cf["potential_tables"].items():
+        assert set(cf["all_props"]) == {label for t, label in stats if t == attype}
+
+
+def test_plan_once(tmp_path):
+    """Planning a table twice doesn't list its junctions twice"""
+    crate = minimal_crate(name="Junctions")
+    for i in range(MAX_NUMBERED_COLS + 2):
+        crate.add("Person", f"#p{i}", {"name": f"Person {i}"})
+    people = [{"@id": f"#p{i}"} for i in range(MAX_NUMBERED_COLS + 2)]
+    crate.add("Thing", "#thing", {"author": people, "contributor": people[:2]})
+    crate.write_json(Path(tmp_path))
+    tb = tabulate(tmp_path, Path(tmp_path) / "sqlite.db")
+    tb.entity_table_plan("Thing")
+    tb.entity_table_plan("Thing")
+    assert tb.cf["tables"]["Thing"]["junctions"] == ["author"]
+    share = tb.db.execute(
+        "SELECT relation_share FROM property_stats "
+        "WHERE entity_type = 'Thing' AND property_label = 'author'"
+    ).fetchone()[0]
+    assert share == 1.0
+
+
+def test_stats_reopened(crates, tmp_path):
+    """A database from before property_stats gets them when it's reopened"""
+    dbfile = Path(tmp_path) / "sqlite.db"
+    tb = ROCrateTabulator()
+    tb.crate_to_db(crates["wide"], dbfile)
+    stats = list(tb.fetch_property_stats())
+    tb.db["property_stats"].drop()
+    tb.close()
+    tbr = ROCrateTabulator()
+    tbr.crate_to_db(crates["wide"], dbfile, rebuild=False)
+    assert list(tbr.fetch_property_stats()) == stats
@@ -45,3 +45,25 @@ def test_wide(crates, tmp_path):
     orig_crate = TinyCrate(crates["wide"])
     dataset = orig_crate.get("./")
     assert dataset
+
+
+def test_junction_schema(crates, tmp_path):
+    tb = ROCrateTabulator()
+    tb.crate_to_db(crates["wide"], Path(tmp_path) / "wide.db")
+    tb.infer_config()
+    tb.cf["tables"]["Dataset"] = tb.cf["potential_tables"]["Dataset"]
+    tb.batch_size = 300
+    tb.entity_table("Dataset")
+
+    junction = tb.db["Dataset_hasPart"]
+    assert junction.columns_dict == {"seq": int, "entity_id": str, "target_id": str}
+    assert junction.pks == ["entity_id", "target_id"]
+    rows = list(junction.rows_where(order_by="seq"))
+    orig_crate = TinyCrate(crates["wide"])
+    hasPart = [part["@id"] for part in orig_crate.get("./")["hasPart"]]
+    assert [row["target_id"] for row in rows] == hasPart
+    assert [row["seq"] for row in rows] == list(range(len(hasPart)))
+
+    # rebuilding the table shouldn't duplicate the links
+    tb.entity_table("Dataset")
+    assert junction.count == len(hasPart)
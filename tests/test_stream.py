@@ -0,0 +1,113 @@
+from pathlib import Path
+from rocrate_tabular.tabulator import (
+    ROCrateTabulator,
+    ROCrateTabulatorException,
+    GraphStream,
+)
+from tinycrate.tinycrate import TinyCrate, minimal_crate
+import io
+import json
+import pytest
+import shutil
+
+
+def property_table(db):
+    return list(db.query("SELECT * FROM property ORDER BY row_id"))
+
+
+@pytest.mark.parametrize("crate", ["minimal", "wide", "languageFamily"])
+def test_stream_matches(crates, tmp_path, crate):
+    """Streaming ingestion should build the same property table"""
+    tb = ROCrateTabulator()
+    tb.crate_to_db(crates[crate], Path(tmp_path) / "loaded.db")
+    tbs = ROCrateTabulator()
+    tbs.crate_to_db(crates[crate], Path(tmp_path) / "streamed.db", stream=True)
+    assert property_table(tbs.db) == property_table(tb.db)
+    assert tbs.crate.context == tb.crate.context
+    tb.close()
+    tbs.close()
+
+
+def test_graph_stream():
+    """Parse with a tiny buffer and @context after the @graph"""
+    graph = [
+        {"@id": "#a", "@type": "Thing", "name": "A", "count": 12345},
+        {"@id": "#b", "@type": ["Thing", "Other"], "about": {"@id": "#a"}},
+    ]
+    jsonld = json.dumps({"@graph": graph, "@context": {"@vocab": "x"}}, indent=1)
+    stream = GraphStream(io.StringIO(jsonld), chunk_size=3)
+    assert list(stream) == graph
+    assert stream.has_graph
+    assert stream.top == {"@context": {"@vocab": "x"}}
+
+
+def test_graph_stream_truncated():
+    stream = GraphStream(io.StringIO('{"@graph": [{"@id": "#a"}, {"@id'))
+    with pytest.raises(ROCrateTabulatorException):
+        list(stream)
+
+
+def test_stream_low_memory(tmp_path):
+    """A streamed database can be reopened and exported without the crate,
+    with local definitions read from the property table"""
+    crate_dir = Path(tmp_path) / "crate"
+    crate = minimal_crate(name="Low memory")
+    crate.add("Thing", "#thing", {"name": "Thing", "colour": "blue"})
+    crate.add("rdf:Property", "http://example.com/colour", {"rdfs:comment": "Hue"})
+    crate.context = {
+        "@vocab": "http://schema.org/",
+        "colour": "http://example.com/colour",
+    }
+    crate.write_json(crate_dir)
+    dbfile = Path(tmp_path) / "streamed.db"
+    tb = ROCrateTabulator()
+    tb.crate_to_db(str(crate_dir), dbfile, stream=True)
+    assert tb.crate.graph == []
+    tb.close()
+
+    shutil.rmtree(crate_dir)
+    tbr = ROCrateTabulator()
+    tbr.crate_to_db(str(crate_dir), dbfile, rebuild=False, stream=True)
+    assert tbr.crate.context == crate.context
+    tbr.infer_config()
+    tbr.cf["export_queries"] = {
+        "things.csv": "SELECT value AS colour FROM property WHERE property_label = 'colour'"
+    }
+    tbr.export_csv(Path(tmp_path) / "csv")
+    column = TinyCrate(Path(tmp_path) / "csv").get("#COLUMN_things.csv_colour")
+    assert column["propertyUrl"] == "http://example.com/colour"
+    assert column["description"] == "Hue"
+
+
+def test_stream_relation_names(tmp_path):
+    """Relations to entities with multi-valued or reference-valued names get
+    the same value whether the crate is streamed or not"""
+    crate_dir = Path(tmp_path) / "crate"
+    crate = minimal_crate(name="Names", date_published="2025-01-01")
+    crate.add("Person", "#a", {"name": ["Alice", "Al"]})
+    crate.add("Person", "#b", {"name": {"@id": "#a"}})
+    crate.add("Person", "#c", {"description": "No name"})
+    crate.add(
+        "Thing",
+        "#t",
+        {"author": [{"@id": "#a"}, {"@id": "#b"}, {"@id": "#c"}, {"@id": "#x"}]},
+    )
+    crate.write_json(crate_dir)
+    tb = ROCrateTabulator()
+    tb.crate_to_db(str(crate_dir), Path(tmp_path) / "loaded.db")
+    tbs = ROCrateTabulator()
+    tbs.crate_to_db(str(crate_dir), Path(tmp_path) / "streamed.db", stream=True)
+    assert property_table(tbs.db) == property_table(tb.db)
+    names = {
+        row["target_id"]: row["value"]
+        for row in property_table(tbs.db)
+        if row["source_id"] == "#t" and row["target_id"]
+    }
+    assert names == {
+        "#a": '["Alice", "Al"]',
+        "#b": '{"@id": "#a"}',
+        "#c": None,
+        "#x": "",
+    }
+    tb.close()
+    tbs.close()
@@ -0,0 +1,50 @@
+from pathlib import Path
+import pytest
+from util import tabulate
+
+
+def text_tabulator(crate, tmp_path):
+    tb = tabulate(crate, Path(tmp_path) / "sqlite.db", ["Dataset"])
+    tb.text_prop = "indexableText"
+    return tb
+
+
+def test_load_text(crates, tmp_path):
+    tb = text_tabulator(crates["textfiles"], tmp_path)
+    tb.text_workers = 2
+    tb.entity_table("Dataset")
+    row = tb.db["Dataset"].get("doc001")
+    with open(
+        Path(crates["textfiles"]) / "doc001/textfile.txt", encoding="utf-8"
+    ) as fh:
+        assert row["indexableText"] == fh.read()
+    assert "indexableText_id" not in tb.db["Dataset"].columns_dict
+    assert not tb.db["text_failure"].exists()
+
+
+def test_text_failures(crates, tmp_path):
+    tb = text_tabulator(crates["utf8"], tmp_path)
+    tb.entity_table("Dataset")
+    row = tb.db["Dataset"].get("doc001")
+    assert row["indexableText"].startswith("load failed")
+    failures = list(tb.db["text_failure"].rows)
+    assert len(failures) == 1
+    assert failures[0]["entity_id"] == "doc001"
+    assert failures[0]["target_id"] == "doc001/textfile.txt"
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_text_failures_rebuilt(crates, tmp_path, jobs):
+    """Building a table again replaces its text failures"""
+    tb = text_tabulator(crates["utf8"], tmp_path)
+    for _ in range(2):
+        list(tb.entity_tables(["Dataset"], jobs=jobs))
+    assert tb.db["text_failure"].count == 1
+
+
+def test_text_max_bytes(crates, tmp_path):
+    tb = text_tabulator(crates["textfiles"], tmp_path)
+    tb.text_max_bytes = 10
+    tb.entity_table("Dataset")
+    failure = next(tb.db["text_failure"].rows)
+    assert "larger than 10 bytes" in failure["error"]
@@ -1,3 +1,4 @@
+from rocrate_tabular.tabulator import ROCrateTabulator
 import json
 
 
@@ -9,3 +10,16 @@ def read_config(cffile):
 def write_config(cf, cffile):
     with open(cffile, "w") as cfh:
         json.dump(cf, cfh)
+
+
+def tabulate(crate, db_file, tables=None, **kwargs):
+    """Load a crate into a new tabulator, infer its config and move the
+    potential tables named in tables, or all of them, to tables. Keyword
+    arguments are passed to crate_to_db."""
+    tb = ROCrateTabulator()
+    tb.crate_to_db(str(crate), db_file, **kwargs)
+    tb.infer_config()
+    potential = tb.cf["potential_tables"]
+    for table in list(potential) if tables is None else tables:
+        tb.cf["tables"][table] = potential.pop(table)
+    return tb